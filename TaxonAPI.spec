@@ -132,6 +132,58 @@ typedef list<ObjectProvenanceAction> ObjectProvenance;
      */
      funcdef get_aliases( ObjectReference ref)  returns (list<string>) authentication optional;
 
+    /**
+     * Retrieve parent Taxon for each of several Taxa.
+     *
+     * @return References to parent Taxons, in the same order as refs.
+     */
+     funcdef get_parent_batch( list<ObjectReference> refs)  returns (list<ObjectReference>) authentication optional;
+
+    /**
+     * Retrieve the scientific lineage for each of several Taxa.
+     *
+     * @return Lineage strings for each Taxon, in the same order as refs.
+     */
+     funcdef get_scientific_lineage_batch( list<ObjectReference> refs)  returns (list<list<string>>) authentication optional;
+
+    /**
+     * Retrieve the scientific name for each of several Taxa.
+     *
+     * @return Scientific names, in the same order as refs.
+     */
+     funcdef get_scientific_name_batch( list<ObjectReference> refs)  returns (list<string>) authentication optional;
+
+    /**
+     * Retrieve the NCBI taxonomic ID for each of several Taxa.
+     *
+     * @return Integer taxonomic IDs, in the same order as refs.
+     */
+     funcdef get_taxonomic_id_batch( list<ObjectReference> refs)  returns (list<int>) authentication optional;
+
+    /**
+     * Retrieve the kingdom for each of several Taxa.
+     *
+     */
+     funcdef get_kingdom_batch( list<ObjectReference> refs)  returns (list<string>) authentication optional;
+
+    /**
+     * Retrieve the domain for each of several Taxa.
+     *
+     */
+     funcdef get_domain_batch( list<ObjectReference> refs)  returns (list<string>) authentication optional;
+
+    /**
+     * Retrieve the genetic code for each of several Taxa.
+     *
+     */
+     funcdef get_genetic_code_batch( list<ObjectReference> refs)  returns (list<int>) authentication optional;
+
+    /**
+     * Retrieve the aliases for each of several Taxa.
+     *
+     */
+     funcdef get_aliases_batch( list<ObjectReference> refs)  returns (list<list<string>>) authentication optional;
+
     /**
      * Retrieve object info.
      * @skip documentation
@@ -228,4 +280,82 @@ typedef list<ObjectProvenanceAction> ObjectProvenance;
      funcdef get_decorated_children(GetDecoratedChildrenParams params)
                     returns (DecoratedChildren) authentication optional;
 
+    /*
+        ref - the taxon whose descendants to list.
+        max_depth - how many levels below ref to go; 0 or unset for all.
+        fields - Taxon data fields to return for each descendant, e.g.
+            scientific_name or taxonomy_id.
+        limit - return at most this many descendants, at least 1; defaults
+            to 10000.
+        cursor - the next_cursor of the previous call; unset for the first.
+     */
+     typedef structure {
+        ObjectReference ref;
+        int max_depth;
+        list<string> fields;
+        int limit;
+        string cursor;
+     } GetSubtreeParams;
+
+     typedef structure {
+        ObjectReference ref;
+        ObjectReference parent;
+        int depth;
+        mapping<string, UnspecifiedObject> data;
+     } SubtreeTaxon;
+
+     /*
+        taxa - descendants in breadth first order, children ordered by
+            workspace, object and version id.
+        truncated - true if there are more.
+        next_cursor - pass as cursor to get the next taxa; empty on the last
+            call. Large subtrees can also be streamed as newline delimited
+            JSON from the /subtree endpoint.
+     */
+     typedef structure {
+        list<SubtreeTaxon> taxa;
+        boolean truncated;
+        string next_cursor;
+     } Subtree;
+
+     funcdef get_subtree(GetSubtreeParams params)
+                    returns (Subtree) authentication optional;
+
+    /*
+        ref - the taxon whose referrers to list.
+        limit - return at most this many refs, at least 1; defaults to 1000.
+        cursor - the next_cursor of the previous page; unset for the first.
+        count_only - only return the count, not the refs.
+     */
+     typedef structure {
+        ObjectReference ref;
+        int limit;
+        string cursor;
+        boolean count_only;
+     } GetReferrersPageParams;
+
+     /*
+        refs - one page of refs, ordered by workspace, object and version id.
+        count - the total number of refs on all pages.
+        next_cursor - pass as cursor to get the next page; empty on the last.
+     */
+     typedef structure {
+        list<ObjectReference> refs;
+        int count;
+        string next_cursor;
+     } ReferrersPage;
+
+    /**
+     * Retrieve children Taxon a page at a time, or count them.
+     */
+     funcdef get_children_page(GetReferrersPageParams params)
+                    returns (ReferrersPage) authentication optional;
+
+    /**
+     * Retrieve the GenomeAnnotation(s) that refer to this Taxon a page at
+     * a time, or count them.
+     */
+     funcdef get_genome_annotations_page(GetReferrersPageParams params)
+                    returns (ReferrersPage) authentication optional;
+
 };
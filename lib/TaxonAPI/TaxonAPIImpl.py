@@ -1,8 +1,24 @@
 # -*- coding: utf-8 -*-
 #BEGIN_HEADER
-from Workspace.WorkspaceClient import Workspace
+from Workspace.baseclient import make_session, ServerError
+from TaxonAPI.access import WorkspaceClients
+from TaxonAPI.cache import ObjectCache, is_versioned_ref
+from TaxonAPI.sharedcache import SharedObjectStore
+from TaxonAPI.lineage import LineageIndex
+from TaxonAPI.snapshot import TaxonomySnapshot
+from TaxonAPI.asyncworkspace import AsyncWorkspace, run_sync
+from TaxonAPI.singleflight import SingleFlight
+from TaxonAPI.batching import BatchDispatcher
+from TaxonAPI.typetable import TypeTable
+from TaxonAPI.metrics import Metrics, propagate
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import bisect
+import itertools
+import json
 import logging
-import functools
+import sqlite3
 # from datetime import datetime
 #END_HEADER
 
@@ -30,31 +46,164 @@ class TaxonAPI:
     _GENOME_TYPES = ['KBaseGenomes.Genome',
                      'KBaseGenomeAnnotations.GenomeAnnotation']
     _TAXON_TYPES = ['KBaseGenomeAnnotations.Taxon']
+    _LINEAGE_FIELDS = ('parent_taxon_ref', 'scientific_name')
+
+    def _access(self, ctx):
+        """Return the workspace access of the caller of a method."""
+        return self.clients.for_context(ctx)
+
+    def _is_public(self, access, wsref):
+        """True if anyone may read the workspace with the given id or name."""
+        if self.snapshot_public and wsref in (
+                str(self.snapshot.workspace_id), self.snapshot.workspace_name):
+            return True
+        key = ('public', wsref)
+        public = self.cache.get(key)
+        if public is None:
+            public = self.flights.do(
+                key, lambda: self._fetch_is_public(access, wsref))
+            self.cache.put(key, public, versioned=False)
+        return public
+
+    def _fetch_is_public(self, access, wsref):
+        ident = {'id': int(wsref)} if wsref.isdigit() else {'workspace': wsref}
+        try:
+            info = access.ws.get_workspace_info(ident)
+        except ServerError:
+            return False  # not readable by this caller, so not public
+        return info[6] != 'n'
 
-    @functools.lru_cache(maxsize=1024)
-    def get_object(self, ref, no_data=False):
-        res = self.ws.get_objects2({
-            'objects': [{'ref': ref}],
-            'no_data': 1 if no_data else 0
-        })['data'][0]
+    def _object_scope(self, access, ref):
+        """
+        The cache scope of an object: None if anyone may read it, else the
+        caller's private scope. An object reached through a ref path is as
+        readable as the first object of the path.
+        """
+        wsref = ref.split(';')[0].split('/')[0].strip()
+        if self._is_public(access, wsref):
+            return None
+        return access.private_scope
+
+    def _object_spec(self, ref, fields=None):
+        """Build a get_objects2 object specification, projected if fields is set."""
+        spec = {'ref': ref}
+        if fields is not None:
+            spec['included'] = ['/' + f for f in fields]
+        return spec
+
+    def _object_key(self, ref, no_data, fields, scope=None):
+        if fields is not None:
+            fields = tuple(sorted(fields))
+        key = ('object', ref, bool(no_data), fields)
+        if scope is not None:
+            key += (scope,)
+        return key
+
+    def _cached_object(self, access, ref, no_data=False, fields=None):
+        """Return the object from the taxonomy snapshot or the cache, or None."""
+        scope = self._object_scope(access, ref)
+        if self.snapshot is not None and scope is None:
+            res = self.snapshot.get_object(ref, no_data, fields)
+            if res is not None:
+                return res
+        return self.cache.get(self._object_key(ref, no_data, fields, scope),
+                              shared=scope is None)
+
+    def _cache_object(self, key, obj, ref, scope):
+        # private objects never go to the node wide shared store
+        self.cache.put(key, obj, is_versioned_ref(ref), shared=scope is None)
+
+    def get_object(self, access, ref, no_data=False, fields=None):
+        res = self._cached_object(access, ref, no_data, fields)
+        if res is None:
+            scope = self._object_scope(access, ref)
+            key = self._object_key(ref, no_data, fields, scope)
+            res = self.flights.do(key, lambda: self._fetch_object(
+                access, key, scope, ref, no_data, fields))
         return res
 
-    def get_data(self, ref):
-        obj = self.get_object(ref)
+    def _fetch_object(self, access, key, scope, ref, no_data, fields):
+        # a concurrent fetch may have finished just before this one started
+        res = self.cache.get(key, shared=scope is None)
+        if res is None:
+            spec = self._object_spec(ref, fields)
+            if self.batcher is not None:
+                res = self.batcher.submit(spec, (access, no_data))
+            if res is None:
+                # not batched, or failed within a batch: fetch it alone so
+                # that the workspace error is raised for this ref only
+                res = self._get_objects2(access, [spec], no_data)[0]
+            self._cache_object(key, res, ref, scope)
+        return res
+
+    def _get_objects2(self, access, specs, no_data, ignore_errors=False):
+        params = {'objects': specs, 'no_data': 1 if no_data else 0}
+        if ignore_errors:
+            params['ignoreErrors'] = 1
+        return access.ws.get_objects2(params)['data']
+
+    def get_data(self, access, ref, fields=None):
+        """Fetch object data, limited to the given top-level fields if any."""
+        obj = self.get_object(access, ref, fields=fields)
         return obj['data']
 
-    @functools.lru_cache(maxsize=1024)
+    def get_objects(self, access, refs, no_data=False, fields=None):
+        """Fetch several objects, requesting all cache misses in one get_objects2 call."""
+        found = {}
+        missing = []
+        for ref in dict.fromkeys(refs):
+            obj = self._cached_object(access, ref, no_data, fields)
+            if obj is None:
+                missing.append(ref)
+            else:
+                found[ref] = obj
+        if missing:
+            res = self._get_objects2(
+                access, [self._object_spec(ref, fields) for ref in missing],
+                no_data)
+            for ref, obj in zip(missing, res):
+                scope = self._object_scope(access, ref)
+                self._cache_object(
+                    self._object_key(ref, no_data, fields, scope), obj, ref,
+                    scope)
+                found[ref] = obj
+        return [found[ref] for ref in refs]
+
+    def get_data_batch(self, access, refs, fields=None):
+        return [obj['data']
+                for obj in self.get_objects(access, refs, fields=fields)]
+
+    def get_data_chunked(self, access, refs, fields=None):
+        """Fetch data for many refs as get_objects2 batches run concurrently."""
+        size = self.fetch_chunk_size
+        chunks = [refs[i:i + size] for i in range(0, len(refs), size)]
+        if len(chunks) <= 1:
+            return self.get_data_batch(access, refs, fields=fields)
+        data = []
+        for chunk_data in self.fetch_pool.map(propagate(
+                lambda chunk: self.get_data_batch(access, chunk, fields=fields)),
+                chunks):
+            data.extend(chunk_data)
+        return data
+
     def translate_to_MD5_types(self, ktype):
-        return self.ws.translate_to_MD5_types([ktype]).values()[0]
+        return self.type_table.translate([ktype])[ktype]
 
-    def get_referrers(self, ref):
-        """Fetch all objects that have a reference to the given object."""
-        referrers = self.ws.list_referencing_objects([{"ref": ref}])[0]
+    def get_referrers(self, access, ref):
+        """
+        Fetch all objects that have a reference to the given object. Callers
+        only see the referrers they may read, so results are scoped to them.
+        """
+        return self.flights.do(('referrers', ref, access.scope),
+                               lambda: self._fetch_referrers(access, ref))
+
+    def _fetch_referrers(self, access, ref):
+        referrers = access.ws.list_referencing_objects([{"ref": ref}])[0]
+        typemap = self.type_table.translate([x[2] for x in referrers])
+        return self._referrers_by_type(referrers, typemap)
+
+    def _referrers_by_type(self, referrers, typemap):
         object_refs_by_type = dict()
-        tlist = []
-        for x in referrers:
-            tlist.append(x[2])
-        typemap = self.ws.translate_to_MD5_types(tlist)
         for x in referrers:
             typestring = typemap[x[2]]
             if typestring not in object_refs_by_type:
@@ -63,14 +212,278 @@ class TaxonAPI:
             object_refs_by_type[typestring].append(upa)
         return object_refs_by_type
 
-    def get_reffers_type(self, ref, types):
-        referrers = self.get_referrers(ref)
+    def _of_types(self, referrers, types):
         children = list()
         for object_type in referrers:
             if object_type.split('-')[0] in types:
                 children.extend(referrers[object_type])
         return children
 
+    def _warm_type_table(self):
+        """
+        Translate every version of the taxon and genome types up front, so
+        listing referrers needs no translation call. Types that show up
+        later are translated when first seen.
+        """
+        try:
+            self.type_table.translate(
+                version for t in self._TAXON_TYPES + self._GENOME_TYPES
+                for version in self.ws.get_type_info(t)['type_vers'])
+        except Exception as e:
+            self.logger.warning('Could not load workspace types: %s', e)
+        finally:
+            # uwsgi forks its workers after this; they must not all share
+            # the keep-alive connection just opened
+            self.ws_session.close()
+
+    def get_reffers_type(self, access, ref, types):
+        return self._of_types(self.get_referrers(access, ref), types)
+
+    def get_child_refs(self, access, ref):
+        """List the refs of the Taxon objects whose parent is ref."""
+        children = self._cached_child_refs(access, ref)
+        if children is None:
+            children = self.get_reffers_type(access, ref, self._TAXON_TYPES)
+            self.cache.put(self._children_key(access, ref), children,
+                           versioned=False)
+        return children
+
+    def get_genome_refs(self, access, ref):
+        """List the refs of the genomes that refer to the taxon ref."""
+        genomes = self._cached_genome_refs(access, ref)
+        if genomes is None:
+            genomes = self.get_reffers_type(access, ref, self._GENOME_TYPES)
+            self.cache.put(self._referrers_key('genomes', access, ref),
+                           genomes, versioned=False)
+        return genomes
+
+    def _cached_genome_refs(self, access, ref):
+        return self.cache.get(self._referrers_key('genomes', access, ref))
+
+    def _children_key(self, access, ref):
+        return self._referrers_key('children', access, ref)
+
+    def _referrers_key(self, kind, access, ref):
+        key = (kind, ref)
+        if access.scope is not None:
+            key += (access.scope,)
+        return key
+
+    def _cached_child_refs(self, access, ref):
+        # the snapshot's children are those when it was built, and only
+        # those in its workspace; a version of ref other than the
+        # snapshot's is listed by the workspace
+        if (self.snapshot_children and
+                self._object_scope(access, ref) is None):
+            index = self.snapshot.index_of(ref)
+            if index is not None:
+                return [self.snapshot.upa(child)
+                        for child in self.snapshot.children(index)]
+        # new children can be saved at any time, even for a versioned ref
+        return self.cache.get(self._children_key(access, ref))
+
+    def get_child_refs_batch(self, access, refs):
+        """List the child refs of several taxa, listing all cache misses in one workspace call."""
+        found = {}
+        missing = []
+        for ref in dict.fromkeys(refs):
+            children = self._cached_child_refs(access, ref)
+            if children is None:
+                missing.append(ref)
+            else:
+                found[ref] = children
+        if missing:
+            referrers = access.ws.list_referencing_objects(
+                [{'ref': ref} for ref in missing])
+            typemap = self.type_table.translate(
+                x[2] for r in referrers for x in r)
+            for ref, r in zip(missing, referrers):
+                children = self._of_types(
+                    self._referrers_by_type(r, typemap), self._TAXON_TYPES)
+                self.cache.put(self._children_key(access, ref), children,
+                               versioned=False)
+                found[ref] = children
+        return [found[ref] for ref in refs]
+
+    def _has_referrers(self, access, ref):
+        """
+        Whether anything refers to ref, from list_referencing_object_counts,
+        which is much cheaper than listing the referrers of a popular taxon.
+        The count covers every type, so only a zero is conclusive.
+        """
+        return access.ws.list_referencing_object_counts([{'ref': ref}])[0] > 0
+
+    def _encode_cursor(self, ref):
+        return base64.urlsafe_b64encode(ref.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor):
+        try:
+            return self._upa_key(
+                base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError('Invalid cursor: ' + repr(cursor))
+
+    def _upa_key(self, upa):
+        ws, obj, ver = upa.split('/')
+        return int(ws), int(obj), int(ver)
+
+    def _limit(self, params, default):
+        limit = params.get('limit', default)
+        if limit is None:
+            return default
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        return limit
+
+    def referrers_page(self, access, ref, kind, params):
+        """
+        One page of the children ('children') or genomes ('genomes') of a
+        taxon, ordered by ref. The cursor is the last ref of the previous
+        page, so pages stay consistent when referrers are added in between.
+        """
+        limit = self._limit(params, 1000)
+        if kind == 'children':
+            list_refs, cached = self.get_child_refs, self._cached_child_refs
+        else:
+            list_refs, cached = self.get_genome_refs, self._cached_genome_refs
+        if params.get('count_only'):
+            refs = cached(access, ref)
+            if refs is None and not self._has_referrers(access, ref):
+                refs = []
+                self.cache.put(self._referrers_key(kind, access, ref), refs,
+                               versioned=False)
+            if refs is None:
+                refs = list_refs(access, ref)
+            return {'refs': [], 'count': len(refs), 'next_cursor': ''}
+        refs = sorted(list_refs(access, ref), key=self._upa_key)
+        start = 0
+        if params.get('cursor'):
+            start = bisect.bisect_right([self._upa_key(r) for r in refs],
+                                        self._decode_cursor(params['cursor']))
+        page = refs[start:start + limit]
+        more = len(page) > 0 and start + limit < len(refs)
+        return {'refs': page, 'count': len(refs),
+                'next_cursor': self._encode_cursor(page[-1]) if more else ''}
+
+    def _encode_subtree_cursor(self, path):
+        return base64.urlsafe_b64encode(
+            json.dumps(list(path)).encode('utf-8')).decode('ascii')
+
+    def _decode_subtree_cursor(self, cursor):
+        try:
+            path = tuple(json.loads(
+                base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')))
+            for ref in path:
+                self._upa_key(ref)
+        except (TypeError, ValueError, UnicodeError, AttributeError):
+            raise ValueError('Invalid cursor: ' + repr(cursor))
+        if not path:
+            raise ValueError('Invalid cursor: ' + repr(cursor))
+        return path
+
+    def _subtree_level(self, access, ref, depth, after=None):
+        """
+        Generate the paths from ref down to its descendants exactly depth
+        levels below it, in breadth first order, children ordered by ref.
+        Given the path of a taxon on that level, start right after it. The
+        parents are pulled lazily from the level above, fetch_chunk_size per
+        workspace call, so a page only lists the children it returns.
+        """
+        if depth == 0:
+            if after is None:
+                yield ()
+            return
+        if after is not None:
+            parent = after[-2] if len(after) > 1 else ref
+            siblings = sorted(self.get_child_refs(access, parent),
+                              key=self._upa_key)
+            start = bisect.bisect_right([self._upa_key(r) for r in siblings],
+                                        self._upa_key(after[-1]))
+            for child in siblings[start:]:
+                yield after[:-1] + (child,)
+        parents = self._subtree_level(
+            access, ref, depth - 1, None if after is None else after[:-1])
+        while True:
+            chunk = list(itertools.islice(parents, self.fetch_chunk_size))
+            if not chunk:
+                return
+            for path, children in zip(chunk, self.get_child_refs_batch(
+                    access, [path[-1] if path else ref for path in chunk])):
+                for child in sorted(children, key=self._upa_key):
+                    yield path + (child,)
+
+    def _subtree_paths(self, access, ref, max_depth=0, after=None):
+        """
+        Generate the paths from ref down to each of its descendants in
+        breadth first order, starting after the path after. Resuming costs
+        about one page of work, rather than walking everything before it.
+        """
+        depth = len(after) if after else 1
+        while not max_depth or depth <= max_depth:
+            found = False
+            for path in self._subtree_level(access, ref, depth, after):
+                found = True
+                yield path
+            if not found and after is None:
+                return
+            after = None
+            depth += 1
+
+    def _subtree_taxa(self, access, ref, paths, fields=None):
+        """Pair each of paths with its SubtreeTaxon, fetching data in chunks."""
+        while True:
+            chunk = list(itertools.islice(paths, self.fetch_chunk_size))
+            if not chunk:
+                return
+            data = [{}] * len(chunk)
+            if fields:
+                data = self.get_data_chunked(
+                    access, [path[-1] for path in chunk], fields=fields)
+            for path, d in zip(chunk, data):
+                yield path, {'ref': path[-1],
+                             'parent': path[-2] if len(path) > 1 else ref,
+                             'depth': len(path),
+                             'data': {f: d[f] for f in fields or [] if f in d}}
+
+    def iter_subtree(self, access, ref, max_depth=0, fields=None, cursor=None):
+        """
+        Generate the descendants of ref in breadth first order, children
+        ordered by ref, as dicts of ref, parent, depth and the requested data
+        fields, starting after cursor if given. Levels are walked
+        fetch_chunk_size parents per workspace call, so only one level of
+        refs is held at a time.
+        """
+        if cursor:
+            paths = self._subtree_paths(access, ref, max_depth,
+                                        self._decode_subtree_cursor(cursor))
+            for _, taxon in self._subtree_taxa(access, ref, paths, fields):
+                yield taxon
+            return
+        frontier = [ref]
+        depth = 0
+        size = self.fetch_chunk_size
+        while frontier and (not max_depth or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for i in range(0, len(frontier), size):
+                parents = frontier[i:i + size]
+                pairs = []
+                for parent, children in zip(
+                        parents, self.get_child_refs_batch(access, parents)):
+                    pairs.extend((child, parent) for child in
+                                 sorted(children, key=self._upa_key))
+                next_frontier.extend(child for child, _ in pairs)
+                data = [{}] * len(pairs)
+                if fields:
+                    data = self.get_data_chunked(
+                        access, [child for child, _ in pairs], fields=fields)
+                for (child, parent), d in zip(pairs, data):
+                    yield {'ref': child,
+                           'parent': parent,
+                           'depth': depth,
+                           'data': {f: d[f] for f in fields or [] if f in d}}
+            frontier = next_frontier
+
     def info_dict(self, i):
         """Convert the object info tuple into a dictionary with keys."""
         omd = i[10]
@@ -92,14 +505,171 @@ class TaxonAPI:
             'object_reference_versioned': '%d/%d/%d' % (i[6], i[0], i[4])
         }
 
-    def _iterate_lineage(self, start_ref):
-        """Generate ancestor taxa going up from a starting point."""
-        obj = self.get_object(start_ref)
-        yield (start_ref, obj)
-        while obj['data'].get('parent_taxon_ref'):
-            ref = obj['data']['parent_taxon_ref']
-            obj = self.get_object(ref)
-            yield (ref, obj)
+    def _iterate_lineage(self, access, start_ref):
+        """Generate (ref, scientific_name) of ancestor taxa going up from a starting point."""
+        known = self.lineage_index.lineage(start_ref)
+        if known is None:
+            known = self._resolve_lineage(access, start_ref)
+        yield from known
+
+    def _index_taxon(self, access, ref, data):
+        # the lineage index is shared by all callers, so only public taxa go in
+        if self._object_scope(access, ref) is None:
+            self.lineage_index.add(ref, data.get('scientific_name'),
+                                   data.get('parent_taxon_ref'))
+
+    def _resolve_lineage(self, access, start_ref):
+        """
+        Walk up from start_ref to the root, returning (ref, scientific_name)
+        for each taxon on the way.
+
+        Each workspace call fetches the next unknown ancestor together with
+        the ancestors predicted from the names in the start's
+        scientific_lineage, as reference paths from start_ref. The workspace
+        checks that each step of a path is referenced by the step before, so
+        a wrong prediction comes back as null and the walk goes on from the
+        last verified ancestor. With no predictions this is one call per hop.
+        """
+        data = self.get_data(access, start_ref, fields=self._LINEAGE_FIELDS +
+                             ('scientific_lineage',))
+        self._index_taxon(access, start_ref, data)
+        chain = [(start_ref, data.get('scientific_name'))]
+        names = [x.strip() for x in (data.get('scientific_lineage') or '').split(';')]
+        predicted = []
+        for name in reversed(names):  # nearest ancestor first
+            ref = self.lineage_index.ref_named(name)
+            if ref is not None and ref not in predicted:
+                predicted.append(ref)
+        path = start_ref.split(';')
+        parent_ref = data.get('parent_taxon_ref')
+        while parent_ref:
+            known = self.lineage_index.lineage(parent_ref)
+            if known is not None:
+                chain.extend(known)
+                break
+            node = self.lineage_index.node(parent_ref)
+            if node is not None:
+                chain.append((parent_ref, node[0]))
+                path.append(parent_ref)
+                parent_ref = node[1]
+                continue
+            hops = [parent_ref] + [ref for ref in predicted if ref != parent_ref]
+            if self._cached_object(access, parent_ref,
+                                   fields=self._LINEAGE_FIELDS):
+                hops = hops[:1]  # e.g. covered by the snapshot
+            for ref, d in zip(hops, self._fetch_lineage_hops(access, path, hops)):
+                if d is None or ref != parent_ref:
+                    # not verified, or verified but not the parent
+                    if ref in predicted:
+                        predicted.remove(ref)
+                    break
+                if ref in predicted:
+                    predicted.remove(ref)
+                self._index_taxon(access, ref, d)
+                chain.append((ref, d.get('scientific_name')))
+                path.append(ref)
+                parent_ref = d.get('parent_taxon_ref')
+        return chain
+
+    def _fetch_lineage_hops(self, access, path, hops):
+        """
+        Fetch the lineage fields of each of hops, reached through path and
+        the hops before it, in one get_objects2 call. Hops after the first
+        that cannot be reached come back as None.
+        """
+        if len(hops) == 1:
+            return [self.get_data(access, hops[0], fields=self._LINEAGE_FIELDS)]
+        objects = []
+        for i in range(len(hops)):
+            spec = self._object_spec(path[0], self._LINEAGE_FIELDS)
+            spec['obj_ref_path'] = path[1:] + hops[:i + 1]
+            objects.append(spec)
+        try:
+            res = self._get_objects2(access, objects, False, ignore_errors=True)
+        except Exception as e:
+            self.logger.debug('Lineage path fetch from %s failed: %s',
+                              path[0], e)
+            return [self.get_data(access, hops[0], fields=self._LINEAGE_FIELDS)]
+        if res[0] is None:
+            # the actual parent is always reachable; report why it is not
+            return [self.get_data(access, hops[0], fields=self._LINEAGE_FIELDS)]
+        for hop, obj in zip(hops, res):
+            if obj is not None:
+                scope = self._object_scope(access, hop)
+                self._cache_object(
+                    self._object_key(hop, False, self._LINEAGE_FIELDS, scope),
+                    obj, hop, scope)
+        return [None if obj is None else obj['data'] for obj in res]
+
+    def _decorated_lineage(self, access, ref):
+        """List TaxonInfo for the ancestors of ref, from the top level down to its parent."""
+        lineage_list = []
+        for (parent_ref, sci_name) in self._iterate_lineage(access, ref):
+            if sci_name == 'root':
+                break
+            lineage_list.append({
+                'ref': parent_ref,
+                'scientific_name': sci_name
+            })
+        lineage_list.reverse()  # reverse list to match scientific_lineage style
+        return lineage_list[:-1]
+
+    def _decorate_children(self, access, children_refs):
+        """List TaxonInfo for each of the given child refs, in order."""
+        children_data = self.get_data_chunked(access, children_refs,
+                                              fields=['scientific_name'])
+        decorated_children = []
+        for child_ref, child_data in zip(children_refs, children_data):
+            if self._object_scope(access, child_ref) is None:
+                self.lineage_index.add_name(child_ref,
+                                            child_data.get('scientific_name'))
+            decorated_children.append({
+                'ref': child_ref,
+                'scientific_name': child_data.get('scientific_name')
+            })
+        return decorated_children
+
+    async def _fetch_all_data(self, access, ref, children, decorated_lineage,
+                              decorated_children):
+        """
+        Fetch the pieces of get_all_data concurrently. Returns the object,
+        its child refs, decorated lineage and decorated children; pieces
+        that were not requested are None.
+        """
+        run = self.async_ws.run_blocking
+
+        async def fetch_lineage():
+            if decorated_lineage:
+                return await run(self._decorated_lineage, access, ref)
+
+        async def fetch_children():
+            if not (children or decorated_children):
+                return None, None
+            children_refs = await run(self.get_child_refs, access, ref)
+            if not decorated_children:
+                return children_refs, None
+            return children_refs, await run(self._decorate_children, access,
+                                            children_refs)
+
+        # wait for every piece before raising, so none is left running
+        results = await asyncio.gather(run(self.get_object, access, ref),
+                                       fetch_lineage(), fetch_children(),
+                                       return_exceptions=True)
+        for res in results:
+            if isinstance(res, Exception):
+                raise res
+        obj, lineage, (children_refs, decorated) = results
+        return obj, children_refs, lineage, decorated
+
+    def stats(self):
+        """Counters of the caches and call coalescing of this process."""
+        stats = {'cache': self.cache.stats(),
+                 'flights': self.flights.stats(),
+                 'lineage_index': self.lineage_index.stats(),
+                 'type_table': self.type_table.stats()}
+        if self.batcher is not None:
+            stats['batcher'] = self.batcher.stats()
+        return stats
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -107,12 +677,85 @@ class TaxonAPI:
     def __init__(self, config):
         #BEGIN_CONSTRUCTOR
         self.workspaceURL = config['workspace-url']
-        self.ws = Workspace(self.workspaceURL)
+        # one pool of keep-alive connections, shared by all server threads
+        pool_size = int(config.get('workspace-pool-size', 16))
+        self.ws_session = make_session(pool_connections=4,
+                                       pool_maxsize=pool_size)
+        # times and counts every workspace call; see the /metrics endpoint
+        self.metrics = Metrics()
+        self.ws_session.hooks['response'].append(
+            self.metrics.workspace_response)
+        # each caller's token is used for their requests; self.ws is the
+        # anonymous client, for calls whose results do not depend on a user
+        self.clients = WorkspaceClients(
+            self.workspaceURL, session=self.ws_session,
+            max_clients=int(config.get('workspace-max-clients', 1000)))
+        self.ws = self.clients.anonymous.ws
         self.shockURL = config['shock-url']
         self.logger = logging.getLogger()
         log_handler = logging.StreamHandler()
         log_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
         self.logger.addHandler(log_handler)
+        shared = None
+        if config.get('shared-cache-path'):
+            try:
+                shared = SharedObjectStore(
+                    config['shared-cache-path'],
+                    max_bytes=int(config.get('shared-cache-max-bytes',
+                                             4 * 1024 * 1024 * 1024)))
+            except (OSError, sqlite3.Error) as e:
+                # e.g. a read-only volume; objects are still cached per process
+                self.logger.warning(
+                    'Shared cache %s is unavailable, using the in-process '
+                    'cache only: %s', config['shared-cache-path'], e)
+        self.cache = ObjectCache(
+            max_bytes=int(config.get('cache-max-bytes', 256 * 1024 * 1024)),
+            versioned_ttl=int(config.get('cache-versioned-ttl', 0)),
+            unversioned_ttl=int(config.get('cache-unversioned-ttl', 300)),
+            shared=shared)
+        # concurrent cache misses for the same object wait for one fetch,
+        # and misses for different objects made while a fetch is in flight
+        # are merged into one call
+        self.flights = SingleFlight()
+        self.batcher = None
+        batch_window = float(config.get('workspace-batch-window-ms', 2)) / 1000
+        if batch_window > 0:
+            # only fetches by the same caller with the same no_data merge
+            self.batcher = BatchDispatcher(
+                lambda specs, key: self._get_objects2(
+                    key[0], specs, key[1], ignore_errors=True),
+                window=batch_window,
+                max_batch=int(config.get('workspace-batch-max-size', 100)))
+        # versioned referrer types are translated once per process
+        self.type_table = TypeTable(
+            lambda types: self.ws.translate_to_MD5_types(types))
+        self._warm_type_table()
+        self.lineage_index = LineageIndex(
+            max_nodes=int(config.get('lineage-index-max-nodes', 500000)))
+        # get_objects2 calls for large ref lists are split into chunks that
+        # share one pool per process, bounding the load on the workspace
+        self.fetch_chunk_size = int(config.get('workspace-fetch-chunk-size', 100))
+        self.fetch_pool = ThreadPoolExecutor(
+            max_workers=int(config.get('workspace-fetch-concurrency', 8)))
+        # runs the independent sub-queries of one request concurrently; kept
+        # apart from fetch_pool, which these sub-queries may wait on
+        self.async_ws = AsyncWorkspace(self.ws, ThreadPoolExecutor(
+            max_workers=int(config.get('workspace-async-concurrency', 16))))
+        self.snapshot = None
+        if config.get('taxonomy-snapshot-path'):
+            self.snapshot = TaxonomySnapshot.load(
+                config['taxonomy-snapshot-path'])
+            self.logger.info('Loaded %d taxa from taxonomy snapshot %s',
+                             len(self.snapshot),
+                             config['taxonomy-snapshot-path'])
+        # a public snapshot workspace is served without checking that it is
+        # public, so snapshot hits need no workspace call at all
+        self.snapshot_public = (
+            self.snapshot is not None and
+            config.get('taxonomy-snapshot-public') == 'true')
+        self.snapshot_children = (
+            self.snapshot is not None and
+            config.get('taxonomy-snapshot-children', 'true') == 'true')
 
         #END_CONSTRUCTOR
         pass
@@ -128,7 +771,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_parent
-        data = self.get_data(ref)
+        data = self.get_data(self._access(ctx), ref)
         returnVal = data.get('parent_taxon_ref', '')
         #END get_parent
 
@@ -149,7 +792,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_children
-        returnVal = self.get_reffers_type(ref, self._TAXON_TYPES)
+        returnVal = self.get_child_refs(self._access(ctx), ref)
         #END get_children
 
         # At some point might do deeper type checking...
@@ -171,7 +814,8 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_genome_annotations
-        returnVal = self.get_reffers_type(ref, self._GENOME_TYPES)
+        returnVal = self.get_reffers_type(self._access(ctx), ref,
+                                          self._GENOME_TYPES)
         #END get_genome_annotations
 
         # At some point might do deeper type checking...
@@ -192,7 +836,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_scientific_lineage
-        o = self.get_data(ref)
+        o = self.get_data(self._access(ctx), ref)
         returnVal = [x.strip() for x in o['scientific_lineage'].split(";")]
         #END get_scientific_lineage
 
@@ -213,7 +857,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_scientific_name
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj['scientific_name']
         #END get_scientific_name
 
@@ -235,7 +879,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_taxonomic_id
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj['taxonomy_id']
         #END get_taxonomic_id
 
@@ -255,7 +899,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_kingdom
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj['kingdom']
         #END get_kingdom
 
@@ -275,7 +919,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_domain
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj['domain']
         #END get_domain
 
@@ -295,7 +939,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_genetic_code
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj['genetic_code']
         #END get_genetic_code
 
@@ -315,7 +959,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_aliases
-        obj = self.get_data(ref)
+        obj = self.get_data(self._access(ctx), ref)
         returnVal = obj.get('aliases', [])
         #END get_aliases
 
@@ -326,6 +970,179 @@ class TaxonAPI:
         # return the results
         return [returnVal]
 
+    def get_parent_batch(self, ctx, refs):
+        """
+        Retrieve parent Taxon for each of several Taxa.
+        @return References to parent Taxons, in the same order as refs.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of type "ObjectReference"
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_parent_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['parent_taxon_ref'])
+        returnVal = [d.get('parent_taxon_ref', '') for d in data]
+        #END get_parent_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_parent_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_scientific_lineage_batch(self, ctx, refs):
+        """
+        Retrieve the scientific lineage for each of several Taxa.
+        @return Lineage strings for each Taxon, in the same order as refs.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of list of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_scientific_lineage_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['scientific_lineage'])
+        returnVal = [[x.strip() for x in d['scientific_lineage'].split(";")]
+                     for d in data]
+        #END get_scientific_lineage_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_scientific_lineage_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_scientific_name_batch(self, ctx, refs):
+        """
+        Retrieve the scientific name for each of several Taxa.
+        @return Scientific names, in the same order as refs.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_scientific_name_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['scientific_name'])
+        returnVal = [d['scientific_name'] for d in data]
+        #END get_scientific_name_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_scientific_name_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_taxonomic_id_batch(self, ctx, refs):
+        """
+        Retrieve the NCBI taxonomic ID for each of several Taxa.
+        @return Integer taxonomic IDs, in the same order as refs.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of Long
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_taxonomic_id_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['taxonomy_id'])
+        returnVal = [d['taxonomy_id'] for d in data]
+        #END get_taxonomic_id_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_taxonomic_id_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_kingdom_batch(self, ctx, refs):
+        """
+        Retrieve the kingdom for each of several Taxa.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_kingdom_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['kingdom'])
+        returnVal = [d['kingdom'] for d in data]
+        #END get_kingdom_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_kingdom_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_domain_batch(self, ctx, refs):
+        """
+        Retrieve the domain for each of several Taxa.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_domain_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['domain'])
+        returnVal = [d['domain'] for d in data]
+        #END get_domain_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_domain_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_genetic_code_batch(self, ctx, refs):
+        """
+        Retrieve the genetic code for each of several Taxa.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of Long
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_genetic_code_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['genetic_code'])
+        returnVal = [d['genetic_code'] for d in data]
+        #END get_genetic_code_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_genetic_code_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
+    def get_aliases_batch(self, ctx, refs):
+        """
+        Retrieve the aliases for each of several Taxa.
+        :param refs: instance of list of type "ObjectReference"
+        :returns: instance of list of list of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_aliases_batch
+        data = self.get_data_chunked(self._access(ctx), refs,
+                                     fields=['aliases'])
+        returnVal = [d.get('aliases', []) for d in data]
+        #END get_aliases_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, list):
+            raise ValueError('Method get_aliases_batch return value ' +
+                             'returnVal is not type list as required.')
+        # return the results
+        return [returnVal]
+
     def get_info(self, ctx, ref):
         """
         Retrieve object info.
@@ -344,7 +1161,7 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_info
-        i = self.get_object(ref, no_data=True)['info']
+        i = self.get_object(self._access(ctx), ref, no_data=True)['info']
         returnVal = self.info_dict(i)
         #END get_info
 
@@ -376,7 +1193,8 @@ class TaxonAPI:
         #BEGIN get_history
         # returnVal = self.ws.get_object_history({'ref': ref})
         returnVal = []
-        for i in self.ws.get_object_history({'ref': ref}):
+        ws = self._access(ctx).ws
+        for i in ws.get_object_history({'ref': ref}):
             returnVal.append(self.info_dict(i))
         #END get_history
 
@@ -413,7 +1231,8 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_provenance
-        prov = self.ws.get_object_provenance([{"ref": ref}])[0]['provenance']
+        ws = self._access(ctx).ws
+        prov = ws.get_object_provenance([{"ref": ref}])[0]['provenance']
         returnVal = []
         copy_keys = {"time": "time",
                      "service": "service_name",
@@ -467,7 +1286,8 @@ class TaxonAPI:
         try:
             returnVal = int(pieces[1])
         except ValueError:
-            returnVal = self.get_object(ref, no_data=True)['info'][0]
+            returnVal = self.get_object(self._access(ctx), ref,
+                                        no_data=True)['info'][0]
         #END get_id
 
         # At some point might do deeper type checking...
@@ -487,7 +1307,8 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_name
-        returnVal = self.get_object(ref, no_data=True)['info'][1]
+        returnVal = self.get_object(self._access(ctx), ref,
+                                    no_data=True)['info'][1]
         #END get_name
 
         # At some point might do deeper type checking...
@@ -509,7 +1330,8 @@ class TaxonAPI:
         #BEGIN get_version
         pieces = ref.split('/')
         if len(pieces) == 2:
-            returnVal = str(self.get_object(ref)['info'][4], no_data=True)
+            returnVal = str(self.get_object(self._access(ctx), ref,
+                                            no_data=True)['info'][4])
         elif len(pieces) == 3:
             returnVal = pieces[2]
         else:
@@ -560,7 +1382,12 @@ class TaxonAPI:
         d = {}
         ref = params['ref']
 
-        obj = self.get_object(ref)
+        want_children = params.get('exclude_children') != 1
+        want_lineage = params.get('include_decorated_scientific_lineage') == 1
+        want_decorated = params.get('include_decorated_children') == 1
+        obj, children, lineage, decorated = run_sync(self._fetch_all_data(
+            self._access(ctx), ref, want_children, want_lineage,
+            want_decorated))
         data = obj['data']
 
         try:
@@ -570,10 +1397,8 @@ class TaxonAPI:
             # +':\n'+ str(traceback.format_exc()))
             d['parent'] = None
 
-        if 'exclude_children' in params and params['exclude_children'] == 1:
-            pass
-        else:
-            d['children'] = self.get_reffers_type(ref, self._TAXON_TYPES)
+        if want_children:
+            d['children'] = children
 
         d['scientific_lineage'] = data['scientific_lineage']
         d['scientific_name'] = data['scientific_name']
@@ -593,15 +1418,11 @@ class TaxonAPI:
             d['aliases'] = data['aliases']
         d['info'] = self.info_dict(obj['info'])
 
-        key = 'include_decorated_scientific_lineage'
-        if key in params and params[key] == 1:
-            l = self.get_decorated_scientific_lineage(ctx, {'ref': ref})[0]
-            d['decorated_scientific_lineage'] = l['decorated_scientific_lineage']
+        if want_lineage:
+            d['decorated_scientific_lineage'] = lineage
 
-        key = 'include_decorated_children'
-        if key in params and params[key] == 1:
-            l = self.get_decorated_children(ctx, {'ref': ref})[0]
-            d['decorated_children'] = l['decorated_children']
+        if want_decorated:
+            d['decorated_children'] = decorated
         #END get_all_data
 
         # At some point might do deeper type checking...
@@ -624,20 +1445,10 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_decorated_scientific_lineage
-
-        lineage_list = []
-        ref = params['ref']
-        for (parent_ref, parent) in self._iterate_lineage(ref):
-            sci_name = parent['data'].get('scientific_name')
-            if sci_name == 'root':
-                break
-            lineage_list.append({
-                'ref': parent_ref,
-                'scientific_name': sci_name
-            })
-        lineage_list.reverse()  # reverse list to match scientific_lineage style
-        returnVal = {'decorated_scientific_lineage': lineage_list[:-1]}
-
+        returnVal = {
+            'decorated_scientific_lineage': self._decorated_lineage(
+                self._access(ctx), params['ref'])
+        }
         #END get_decorated_scientific_lineage
 
         # At some point might do deeper type checking...
@@ -659,17 +1470,11 @@ class TaxonAPI:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN get_decorated_children
-        ref = params['ref']
-        children_refs = self.get_reffers_type(ref, self._TAXON_TYPES)
-        decorated_children = []
-        for child_ref in children_refs:
-            child_data = self.get_data(child_ref)
-            decorated_children.append({
-                'ref': child_ref,
-                'scientific_name': child_data.get('scientific_name')
-            })
-
-        returnVal = {'decorated_children': decorated_children}
+        access = self._access(ctx)
+        children_refs = self.get_child_refs(access, params['ref'])
+        returnVal = {
+            'decorated_children': self._decorate_children(access, children_refs)
+        }
         #END get_decorated_children
 
         # At some point might do deeper type checking...
@@ -678,9 +1483,126 @@ class TaxonAPI:
                              'returnVal is not type dict as required.')
         # return the results
         return [returnVal]
+
+    def get_subtree(self, ctx, params):
+        """
+        :param params: instance of type "GetSubtreeParams" (ref - the taxon
+           whose descendants to list. max_depth - how many levels below ref
+           to go; 0 or unset for all. fields - Taxon data fields to return
+           for each descendant, e.g. scientific_name or taxonomy_id. limit -
+           return at most this many descendants, at least 1; defaults to
+           10000. cursor - the next_cursor of the previous call; unset for
+           the first.) -> structure: parameter "ref" of type
+           "ObjectReference", parameter "max_depth" of Long, parameter
+           "fields" of list of String, parameter "limit" of Long, parameter
+           "cursor" of String
+        :returns: instance of type "Subtree" (taxa - descendants in breadth
+           first order, children ordered by workspace, object and version
+           id. truncated - true if there are more. next_cursor - pass as
+           cursor to get the next taxa; empty on the last call. Large
+           subtrees can also be streamed as newline delimited JSON from the
+           /subtree endpoint.) -> structure: parameter "taxa" of list of type
+           "SubtreeTaxon" -> structure: parameter "ref" of type
+           "ObjectReference", parameter "parent" of type "ObjectReference",
+           parameter "depth" of Long, parameter "data" of mapping from String
+           to unspecified object, parameter "truncated" of type "boolean" (A
+           boolean. 0 = false, other = true.), parameter "next_cursor" of
+           String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_subtree
+        limit = self._limit(params, 10000)
+        access = self._access(ctx)
+        after = None
+        if params.get('cursor'):
+            after = self._decode_subtree_cursor(params['cursor'])
+        paths = self._subtree_paths(access, params['ref'],
+                                    params.get('max_depth') or 0, after)
+        page = list(itertools.islice(self._subtree_taxa(
+            access, params['ref'], paths, params.get('fields')), limit + 1))
+        more = len(page) > limit
+        returnVal = {'taxa': [taxon for _, taxon in page[:limit]],
+                     'truncated': 1 if more else 0,
+                     'next_cursor': self._encode_subtree_cursor(
+                         page[limit - 1][0]) if more else ''}
+        #END get_subtree
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_subtree return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
+    def get_children_page(self, ctx, params):
+        """
+        Retrieve children Taxon a page at a time, or count them.
+        :param params: instance of type "GetReferrersPageParams" (ref - the
+           taxon whose referrers to list. limit - return at most this many
+           refs, at least 1; defaults to 1000. cursor - the next_cursor of
+           the previous page; unset for the first. count_only - only return
+           the count, not the refs.) -> structure: parameter "ref" of type
+           "ObjectReference", parameter "limit" of Long, parameter "cursor" of
+           String, parameter "count_only" of type "boolean" (A boolean. 0 =
+           false, other = true.)
+        :returns: instance of type "ReferrersPage" (refs - one page of refs,
+           ordered by workspace, object and version id. count - the total
+           number of refs on all pages. next_cursor - pass as cursor to get
+           the next page; empty on the last.) -> structure: parameter "refs"
+           of list of type "ObjectReference", parameter "count" of Long,
+           parameter "next_cursor" of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_children_page
+        returnVal = self.referrers_page(self._access(ctx), params['ref'],
+                                        'children', params)
+        #END get_children_page
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_children_page return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
+    def get_genome_annotations_page(self, ctx, params):
+        """
+        Retrieve the GenomeAnnotation(s) that refer to this Taxon a page at
+        a time, or count them.
+        :param params: instance of type "GetReferrersPageParams" (ref - the
+           taxon whose referrers to list. limit - return at most this many
+           refs, at least 1; defaults to 1000. cursor - the next_cursor of
+           the previous page; unset for the first. count_only - only return
+           the count, not the refs.) -> structure: parameter "ref" of type
+           "ObjectReference", parameter "limit" of Long, parameter "cursor" of
+           String, parameter "count_only" of type "boolean" (A boolean. 0 =
+           false, other = true.)
+        :returns: instance of type "ReferrersPage" (refs - one page of refs,
+           ordered by workspace, object and version id. count - the total
+           number of refs on all pages. next_cursor - pass as cursor to get
+           the next page; empty on the last.) -> structure: parameter "refs"
+           of list of type "ObjectReference", parameter "count" of Long,
+           parameter "next_cursor" of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_genome_annotations_page
+        returnVal = self.referrers_page(self._access(ctx), params['ref'],
+                                        'genomes', params)
+        #END get_genome_annotations_page
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_genome_annotations_page return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK", 'message': "", 'version': self.VERSION,
-                     'git_url': self.GIT_URL, 'git_commit_hash': self.GIT_COMMIT_HASH}
+                     'git_url': self.GIT_URL, 'git_commit_hash': self.GIT_COMMIT_HASH,
+                     'stats': self.stats()}
         #END_STATUS
         return [returnVal]
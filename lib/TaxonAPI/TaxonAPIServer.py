@@ -5,10 +5,14 @@ import json
 import os
 import random as _random
 import sys
+import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from getopt import getopt, GetoptError
 from multiprocessing import Process
 from os import environ
+from urllib.parse import parse_qs
 from wsgiref.simple_server import make_server
 
 import requests as _requests
@@ -18,6 +22,7 @@ from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from TaxonAPI.authclient import KBaseAuth as _KBaseAuth
+from TaxonAPI.metrics import trace_header
 
 try:
     from ConfigParser import ConfigParser
@@ -69,6 +74,12 @@ class JSONObjectEncoder(json.JSONEncoder):
 
 class JSONRPCServiceCustom(JSONRPCService):
 
+    # Runs the members of batch requests concurrently; set by Application.
+    # If None, batch members are run one after another.
+    batch_pool = None
+    # Times method calls (TaxonAPI.metrics.Metrics); set by Application.
+    metrics = None
+
     def call(self, ctx, jsondata):
         """
         Calls jsonrpc service's method and returns its return value in a JSON
@@ -157,14 +168,28 @@ class JSONRPCServiceCustom(JSONRPCService):
             requests = []
             responds = []
 
+            errors = []
             for rdata_ in rdata:
                 # set some default values for error handling
                 request_ = self._get_default_vals()
-                self._fill_request(request_, rdata_)
-                requests.append(request_)
+                try:
+                    self._fill_request(request_, rdata_)
+                    if not _is_valid_request(rdata_):
+                        raise InvalidRequestError
+                except JSONRPCError as e:
+                    # an invalid request gets an error of its own; the
+                    # others are still run
+                    errors.append(self._get_err(e, request_['id'],
+                                                request_['jsonrpc']))
+                    requests.append(None)
+                else:
+                    errors.append(None)
+                    requests.append(request_)
 
-            for request_ in requests:
-                respond = self._handle_request(ctx, request_)
+            valid = [r for r in requests if r is not None]
+            handled = iter(self._handle_batch(ctx, valid) if valid else [])
+            for request_, error in zip(requests, errors):
+                respond = error if request_ is None else next(handled)
                 # Don't respond to notifications
                 if respond is not None:
                     responds.append(respond)
@@ -183,8 +208,89 @@ class JSONRPCServiceCustom(JSONRPCService):
         if 'types' in self.method_data[request['method']]:
             self._validate_params_types(request['method'], request['params'])
 
-        result = self._call_method(ctx, request)
+        result = self._observed_call(ctx, request)
+        return self._traced(self._make_respond(request, result),
+                            ctx.get('trace'))
 
+    def _handle_batch(self, ctx, requests):
+        """
+        Handles the requests of a batch concurrently and returns their
+        responses in the same order. Requests for the same method with the
+        same params are only run once. A request that fails gets an error
+        response of its own; the others still get their results.
+        """
+        keys = [(request['method'],
+                 json.dumps(request['params'], sort_keys=True))
+                for request in requests]
+        unique = OrderedDict()
+        for key, request in zip(keys, requests):
+            unique.setdefault(key, request)
+
+        def run(request):
+            member = _member_context(ctx, request)
+            if ctx.get('trace') is not None:
+                # each member's response carries its own trace
+                member['trace'] = []
+            try:
+                if 'types' in self.method_data[request['method']]:
+                    self._validate_params_types(request['method'],
+                                                request['params'])
+                return self._observed_call(member, request), None, \
+                    member.get('trace')
+            except Exception as e:
+                if not isinstance(e, JSONRPCError):
+                    e = JSONServerError()
+                    e.trace = traceback.format_exc()
+                if getattr(e, 'trace', None):
+                    member.log_err(e.trace.split('\n')[0:-1])
+                return None, e, member.get('trace')
+            finally:
+                if ctx.get('trace') is not None:
+                    ctx['trace'].extend(member['trace'])
+
+        if self.batch_pool is None or len(unique) == 1:
+            results = [run(request) for request in unique.values()]
+        else:
+            futures = [self.batch_pool.submit(run, request)
+                       for request in unique.values()]
+            for future in futures:
+                future.exception()  # wait for all
+            results = [future.result() for future in futures]
+        results = dict(zip(unique.keys(), results))
+        responds = []
+        for key, request in zip(keys, requests):
+            result, error, trace = results[key]
+            if error is None:
+                respond = self._make_respond(request, result)
+            else:
+                respond = self._make_error_respond(request, error)
+            responds.append(self._traced(respond, trace))
+        return responds
+
+    def _traced(self, respond, trace):
+        """Adds the trace of a traced request to its response."""
+        if respond is not None and trace is not None:
+            respond['trace'] = trace
+        return respond
+
+    def _observed_call(self, ctx, request):
+        """
+        Calls the method of a request, recording its metrics. If the request
+        is traced, its workspace calls are added to ctx['trace'].
+        """
+        if self.metrics is None:
+            return self._call_method(ctx, request)
+        trace = ctx.get('trace')
+        tally = None
+        try:
+            with self.metrics.request(request['method'],
+                                      trace=trace is not None) as tally:
+                return self._call_method(ctx, request)
+        finally:
+            if trace is not None and tally is not None:
+                trace.append(tally.summary())
+
+    def _make_respond(self, request, result):
         # Do not respond to notifications.
         if request['id'] is None:
             return None
@@ -196,6 +302,58 @@ class JSONRPCServiceCustom(JSONRPCService):
 
         return respond
 
+    def _make_error_respond(self, request, error):
+        """
+        The response to a failed request of a batch, in the form that
+        Application.process_error gives a failed single request.
+        """
+        # Do not respond to notifications.
+        if request['id'] is None:
+            return None
+
+        trace = getattr(error, 'trace', None)
+        respond = {'id': request['id'],
+                   'error': {'code': error.code,
+                             'name': error.message,
+                             'message': error.data}}
+        if request['jsonrpc'] == 20:
+            respond['jsonrpc'] = '2.0'
+            respond['error']['data'] = trace
+        else:
+            respond['version'] = '1.1' if request['jsonrpc'] == 11 else '1.0'
+            respond['error']['error'] = trace
+
+        return respond
+
+
+def _is_valid_request(rdata):
+    """
+    True if a request names a module method and has params. Requests
+    without an id are notifications, which are run but get no response.
+    """
+    return (isinstance(rdata, dict) and
+            isinstance(rdata.get('method'), str) and
+            '.' in rdata['method'] and
+            isinstance(rdata.get('params'), (list, dict)))
+
+
+def _member_context(ctx, request):
+    """Returns a copy of the batch context for one of its requests."""
+    member = MethodContext(ctx._logger)
+    member.update(ctx)
+    member['module'], member['method'] = request['method'].split('.')
+    member['call_id'] = request['id']
+    member['provenance'] = [{'service': member['module'],
+                             'method': member['method'],
+                             'method_params': request['params']
+                             }]
+    if ctx['rpc_context'] is not None:
+        member['rpc_context'] = dict(ctx['rpc_context'])
+        member['rpc_context']['call_stack'] = [
+            dict(ctx['rpc_context']['call_stack'][0],
+                 method=request['method'])]
+    return member
+
 
 class MethodContext(dict):
 
@@ -337,6 +495,13 @@ class Application(object):
             call_id=True, logfile=self.userlog.get_log_file())
         self.serverlog.set_log_level(6)
         self.rpc_service = JSONRPCServiceCustom()
+        batch_concurrency = 8
+        if config is not None:
+            batch_concurrency = int(config.get('batch-concurrency', 8))
+        if batch_concurrency > 1:
+            self.rpc_service.batch_pool = ThreadPoolExecutor(
+                max_workers=batch_concurrency)
+        self.rpc_service.metrics = impl_TaxonAPI.metrics
         self.method_authentication = dict()
         self.rpc_service.add(impl_TaxonAPI.get_parent,
                              name='TaxonAPI.get_parent',
@@ -378,6 +543,38 @@ class Application(object):
                              name='TaxonAPI.get_aliases',
                              types=[str])
         self.method_authentication['TaxonAPI.get_aliases'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_parent_batch,
+                             name='TaxonAPI.get_parent_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_parent_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_scientific_lineage_batch,
+                             name='TaxonAPI.get_scientific_lineage_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_scientific_lineage_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_scientific_name_batch,
+                             name='TaxonAPI.get_scientific_name_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_scientific_name_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_taxonomic_id_batch,
+                             name='TaxonAPI.get_taxonomic_id_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_taxonomic_id_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_kingdom_batch,
+                             name='TaxonAPI.get_kingdom_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_kingdom_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_domain_batch,
+                             name='TaxonAPI.get_domain_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_domain_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_genetic_code_batch,
+                             name='TaxonAPI.get_genetic_code_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_genetic_code_batch'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_aliases_batch,
+                             name='TaxonAPI.get_aliases_batch',
+                             types=[list])
+        self.method_authentication['TaxonAPI.get_aliases_batch'] = 'optional'  # noqa
         self.rpc_service.add(impl_TaxonAPI.get_info,
                              name='TaxonAPI.get_info',
                              types=[str])
@@ -414,6 +611,18 @@ class Application(object):
                              name='TaxonAPI.get_decorated_children',
                              types=[dict])
         self.method_authentication['TaxonAPI.get_decorated_children'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_subtree,
+                             name='TaxonAPI.get_subtree',
+                             types=[dict])
+        self.method_authentication['TaxonAPI.get_subtree'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_children_page,
+                             name='TaxonAPI.get_children_page',
+                             types=[dict])
+        self.method_authentication['TaxonAPI.get_children_page'] = 'optional'  # noqa
+        self.rpc_service.add(impl_TaxonAPI.get_genome_annotations_page,
+                             name='TaxonAPI.get_genome_annotations_page',
+                             types=[dict])
+        self.method_authentication['TaxonAPI.get_genome_annotations_page'] = 'optional'  # noqa
         self.rpc_service.add(impl_TaxonAPI.status,
                              name='TaxonAPI.status',
                              types=[dict])
@@ -421,6 +630,11 @@ class Application(object):
         self.auth_client = _KBaseAuth(authurl)
 
     def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '').rstrip('/')
+        if path == '/subtree':
+            return self.stream_subtree(environ, start_response)
+        if path == '/metrics':
+            return self.metrics(environ, start_response)
         # Context object, equivalent to the perl impl CallContext
         ctx = MethodContext(self.userlog)
         ctx['client_ip'] = getIPAddress(environ)
@@ -446,25 +660,47 @@ class Application(object):
                        }
                 rpc_result = self.process_error(err, ctx, {'version': '1.1'})
             else:
-                ctx['module'], ctx['method'] = req['method'].split('.')
-                ctx['call_id'] = req['id']
-                ctx['rpc_context'] = {
-                    'call_stack': [{'time': self.now_in_utc(),
-                                    'method': req['method']}
-                                   ]
-                }
-                prov_action = {'service': ctx['module'],
-                               'method': ctx['method'],
-                               'method_params': req['params']
-                               }
-                ctx['provenance'] = [prov_action]
                 try:
+                    if isinstance(req, list):
+                        if not req:
+                            raise InvalidRequestError
+                        # invalid members get errors of their own from
+                        # rpc_service
+                        members = [m for m in req if _is_valid_request(m)]
+                    elif _is_valid_request(req):
+                        members = [req]
+                    else:
+                        raise InvalidRequestError
+                    if members:
+                        # a batch is logged under the first of its requests
+                        first = members[0]
+                        ctx['module'], ctx['method'] = \
+                            first['method'].split('.', 1)
+                        ctx['call_id'] = first.get('id')
+                        ctx['rpc_context'] = {
+                            'call_stack': [{'time': self.now_in_utc(),
+                                            'method': first['method']}
+                                           ]
+                        }
+                    if environ.get('HTTP_X_TAXONAPI_TRACE'):
+                        # filled in by the calls; shared by all batch members
+                        ctx['trace'] = []
+                    ctx['provenance'] = []
+                    for member in members:
+                        module, method = member['method'].split('.', 1)
+                        prov_action = {'service': module,
+                                       'method': method,
+                                       'method_params': member['params']
+                                       }
+                        ctx['provenance'].append(prov_action)
                     token = environ.get('HTTP_AUTHORIZATION')
-                    # parse out the method being requested and check if it
-                    # has an authentication requirement
-                    method_name = req['method']
-                    auth_req = self.method_authentication.get(
-                        method_name, 'none')
+                    # parse out the methods being requested and check if
+                    # any has an authentication requirement
+                    auth_levels = ['none', 'optional', 'required']
+                    auth_req = max(
+                        (self.method_authentication.get(m['method'], 'none')
+                         for m in members), key=auth_levels.index,
+                        default='none')
                     if auth_req != 'none':
                         if token is None and auth_req == 'required':
                             err = JSONServerError()
@@ -501,7 +737,8 @@ class Application(object):
                                      }
                            }
                     trace = jre.trace if hasattr(jre, 'trace') else None
-                    rpc_result = self.process_error(err, ctx, req, trace)
+                    rpc_result = self.process_error(
+                        err, ctx, req if isinstance(req, dict) else {}, trace)
                 except Exception:
                     err = {'error': {'code': 0,
                                      'name': 'Unexpected Server Error',
@@ -509,8 +746,9 @@ class Application(object):
                                                 'occurred',
                                      }
                            }
-                    rpc_result = self.process_error(err, ctx, req,
-                                                    traceback.format_exc())
+                    rpc_result = self.process_error(
+                        err, ctx, req if isinstance(req, dict) else {},
+                        traceback.format_exc())
 
         # print('Request method was %s\n' % environ['REQUEST_METHOD'])
         # print('Environment dictionary is:\n%s\n' % pprint.pformat(environ))
@@ -529,9 +767,114 @@ class Application(object):
                 'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
             ('content-type', 'application/json'),
             ('content-length', str(len(response_body)))]
+        if ctx.get('trace') is not None:
+            # in full in the response body, where there is one
+            response_headers += [
+                ('X-TaxonAPI-Trace', trace_header(ctx['trace'])),
+                ('Access-Control-Expose-Headers', 'X-TaxonAPI-Trace')]
+            self.log(log.INFO, ctx, 'trace: ' + json.dumps(ctx['trace']))
         start_response(status, response_headers)
         return [response_body.encode('utf8')]
 
+    def metrics(self, environ, start_response):
+        '''
+        Reports method latencies, workspace calls and cache statistics of
+        the worker process that serves the request, in the Prometheus text
+        format.
+        '''
+        body = impl_TaxonAPI.metrics.render(impl_TaxonAPI.stats()).encode(
+            'utf8')
+        start_response('200 OK', [
+            ('content-type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('content-length', str(len(body)))])
+        return [body]
+
+    def stream_subtree(self, environ, start_response):
+        '''
+        Streams the descendants of a taxon as newline delimited JSON, one
+        SubtreeTaxon per line, in breadth first order. Takes the
+        GetSubtreeParams of get_subtree (without limit) as a JSON request
+        body, or as query parameters with fields separated by commas, e.g.
+        GET /subtree?ref=ReferenceTaxons/2_taxon/1&max_depth=2&fields=scientific_name
+        A next_cursor from get_subtree streams the rest of that subtree.
+        If the traversal fails part way, the last line is an error object.
+        '''
+        ctx = MethodContext(self.userlog)
+        ctx['client_ip'] = getIPAddress(environ)
+        ctx['module'], ctx['method'] = 'TaxonAPI', 'get_subtree'
+        headers = [('Access-Control-Allow-Origin', '*'),
+                   ('Access-Control-Allow-Headers', environ.get(
+                       'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization'))]
+
+        def fail(status, message):
+            body = json.dumps({'error': message}).encode('utf8')
+            start_response(status, headers + [
+                ('content-type', 'application/json'),
+                ('content-length', str(len(body)))])
+            return [body]
+
+        if environ['REQUEST_METHOD'] == 'OPTIONS':
+            start_response('200 OK', headers + [('content-length', '0')])
+            return [b'']
+        try:
+            if environ['REQUEST_METHOD'] == 'POST':
+                body_size = int(environ.get('CONTENT_LENGTH') or 0)
+                params = json.loads(environ['wsgi.input'].read(body_size))
+            else:
+                query = parse_qs(environ.get('QUERY_STRING', ''))
+                params = {k: v[0] for k, v in query.items()}
+                if 'fields' in params:
+                    params['fields'] = params['fields'].split(',')
+            ref = params['ref']
+            max_depth = int(params.get('max_depth') or 0)
+            cursor = params.get('cursor')
+            if cursor:
+                impl_TaxonAPI._decode_subtree_cursor(cursor)
+        except (ValueError, KeyError, TypeError) as e:
+            return fail('400 Bad Request', 'Invalid subtree request: %s' % e)
+        token = environ.get('HTTP_AUTHORIZATION')
+        if token:
+            try:
+                ctx['user_id'] = self.auth_client.get_user(token)
+                ctx['authenticated'] = 1
+                ctx['token'] = token
+            except Exception as e:
+                return fail('401 Unauthorized',
+                            'Token validation failed: %s' % e)
+        self.log(log.INFO, ctx, 'start method')
+        started = time.perf_counter()
+        taxa = impl_TaxonAPI.iter_subtree(
+            impl_TaxonAPI._access(ctx), ref, max_depth=max_depth,
+            fields=params.get('fields'), cursor=cursor)
+        try:
+            # fail with a proper status if the first level cannot be listed
+            first = next(taxa, None)
+        except Exception as e:
+            self.log(log.ERR, ctx, traceback.format_exc().split('\n')[0:-1])
+            impl_TaxonAPI.metrics.observe_request(
+                'TaxonAPI.stream_subtree', time.perf_counter() - started, True)
+            return fail('500 Internal Server Error', str(e))
+        start_response('200 OK', headers + [
+            ('content-type', 'application/x-ndjson')])
+
+        def lines():
+            failed = False
+            try:
+                if first is not None:
+                    yield (json.dumps(first) + '\n').encode('utf8')
+                    for taxon in taxa:
+                        yield (json.dumps(taxon) + '\n').encode('utf8')
+            except Exception as e:
+                failed = True
+                self.log(log.ERR, ctx,
+                         traceback.format_exc().split('\n')[0:-1])
+                yield (json.dumps({'error': str(e)}) + '\n').encode('utf8')
+            impl_TaxonAPI.metrics.observe_request(
+                'TaxonAPI.stream_subtree', time.perf_counter() - started,
+                failed)
+            self.log(log.INFO, ctx, 'end method')
+        return lines()
+
     def process_error(self, error, context, request, trace=None):
         if trace:
             self.log(log.ERR, context, trace.split('\n')[0:-1])
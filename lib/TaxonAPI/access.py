@@ -0,0 +1,76 @@
+'''
+Per caller workspace access.
+
+Requests are served with the caller's own token so that private taxonomy
+workspaces can be read. Cached results are scoped: objects in workspaces
+anyone can read are shared by all callers, while anything else is cached
+for one user only (see TaxonAPIImpl._object_scope).
+'''
+import hashlib as _hashlib
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+
+from Workspace.WorkspaceClient import Workspace as _Workspace
+
+
+class WorkspaceAccess(object):
+    '''
+    The workspace client of one caller and the scope of the results it may
+    see.
+
+    ws - the Workspace client to make calls with.
+    user - the caller's user id, if known.
+    scope - None for anonymous callers, who can only see public data, or a
+        key identifying the caller's private cache scope.
+    '''
+
+    def __init__(self, ws, user=None, scope=None):
+        self.ws = ws
+        self.user = user
+        self.scope = scope
+
+    @property
+    def private_scope(self):
+        ''' The scope for results that not everyone may see. '''
+        return self.scope or ('anonymous',)
+
+
+class WorkspaceClients(object):
+    '''
+    Hands out a WorkspaceAccess per token, reusing those of recent callers.
+    All clients share one requests session, and so one connection pool.
+    '''
+
+    def __init__(self, url, session=None, max_clients=1000):
+        self._url = url
+        self._session = session
+        self._max_clients = max_clients
+        self._lock = _threading.Lock()
+        # token -> WorkspaceAccess
+        self._clients = _OrderedDict()
+        self.anonymous = WorkspaceAccess(_Workspace(url, session=session))
+
+    def for_context(self, ctx):
+        ''' Return the access of the caller of a method. '''
+        token = ctx.get('token') if ctx else None
+        if not token:
+            return self.anonymous
+        user = ctx.get('user_id')
+        with self._lock:
+            access = self._clients.get(token)
+            if access is not None and access.user == user:
+                self._clients.move_to_end(token)
+                return access
+            if user:
+                scope = ('user', user)
+            else:
+                # never keep the token itself in cache keys
+                scope = ('token',
+                         _hashlib.sha256(token.encode('utf-8')).hexdigest())
+            access = WorkspaceAccess(
+                _Workspace(self._url, token=token, session=self._session),
+                user=user, scope=scope)
+            self._clients[token] = access
+            if len(self._clients) > self._max_clients:
+                self._clients.popitem(last=False)
+            return access
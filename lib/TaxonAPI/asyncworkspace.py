@@ -0,0 +1,65 @@
+'''
+An asyncio interface to the Workspace service.
+
+The generated Workspace client blocks for the length of each call.
+AsyncWorkspace runs those calls in a thread pool and exposes them as
+coroutines, so one request can await several independent workspace calls at
+once. All of them go through the wrapped client's pooled keep-alive session
+(see Workspace.baseclient.make_session).
+
+Server threads have no event loop of their own; run_sync drives a coroutine
+to completion on a private loop and returns its result.
+'''
+import asyncio as _asyncio
+import functools as _functools
+
+from TaxonAPI.metrics import propagate as _propagate
+
+
+def run_sync(coro):
+    ''' Run a coroutine on a new event loop and return its result. '''
+    loop = _asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncWorkspace(object):
+    '''
+    Wraps a Workspace client so that each of its methods returns an
+    awaitable instead of blocking, e.g.
+
+        info, objs = await asyncio.gather(
+            aws.get_object_info3({'objects': [{'ref': ref}]}),
+            aws.get_objects2({'objects': [{'ref': other}]}))
+
+    ws - the Workspace client to wrap.
+    executor - the concurrent.futures executor that runs the blocking calls.
+        It must not be one that the calls themselves wait on, or they may
+        deadlock when it is saturated.
+    '''
+
+    def __init__(self, ws, executor):
+        self._ws = ws
+        self._executor = executor
+
+    def run_blocking(self, func, *args, **kwargs):
+        '''
+        Run any blocking callable in the executor, e.g. a helper that checks
+        a cache before calling the workspace. Returns an awaitable. Workspace
+        calls it makes count towards the current request's metrics.
+        '''
+        loop = _asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, _functools.partial(
+            _propagate(func), *args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._ws, name)
+        if not callable(method):
+            return method
+
+        @_functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self.run_blocking(method, *args, **kwargs)
+        return call
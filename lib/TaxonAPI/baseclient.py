@@ -9,6 +9,7 @@ from __future__ import print_function
 
 import json as _json
 import requests as _requests
+from requests.adapters import HTTPAdapter as _HTTPAdapter
 import random as _random
 import os as _os
 import traceback as _traceback
@@ -72,6 +73,21 @@ def _read_inifile(file=_os.environ.get(  # @ReservedAssignment
     return authdata
 
 
+def make_session(pool_connections=10, pool_maxsize=10):
+    '''
+    Create a requests Session that keeps connections alive between calls.
+    A session may be shared by many clients and threads.
+    pool_connections - the number of hosts to keep a connection pool for.
+    pool_maxsize - the maximum number of connections kept open per host.
+    '''
+    session = _requests.Session()
+    adapter = _HTTPAdapter(pool_connections=pool_connections,
+                           pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 class ServerError(Exception):
 
     def __init__(self, name, code, message, data=None, error=None):
@@ -120,6 +136,9 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    session - a requests Session (see make_session) used for all calls, so
+        that connections are pooled and kept alive. By default every call
+        opens a new connection.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -129,7 +148,8 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            session=None):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -137,6 +157,7 @@ class BaseClient(object):
             raise ValueError(url + " isn't a valid http url")
         self.url = url
         self.timeout = int(timeout)
+        self._session = session
         self._headers = dict()
         self.trust_all_ssl_certificates = trust_all_ssl_certificates
         self.lookup_url = lookup_url
@@ -176,9 +197,10 @@ class BaseClient(object):
             arg_hash['context'] = context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        poster = _requests if self._session is None else self._session
+        ret = poster.post(url, data=body, headers=self._headers,
+                          timeout=self.timeout,
+                          verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
@@ -0,0 +1,108 @@
+'''
+Micro-batching of concurrent single object fetches.
+
+Server threads that miss the cache for different objects at about the same
+time each want one get_objects2 call. A BatchDispatcher sends a fetch at
+once when none is in flight, so a lone fetch never waits. Fetches that
+arrive while one is in flight are queued behind it and sent together in one
+call when it completes, when the batch is full or when the window has
+passed, whichever comes first.
+
+There is no background thread: the first caller queued behind a fetch waits
+and then fetches for everyone, or the caller that fills the batch fetches at
+once. That keeps the dispatcher safe to create before uwsgi forks its
+workers.
+'''
+import threading as _threading
+import time as _time
+from concurrent.futures import Future as _Future
+
+
+class BatchDispatcher(object):
+    '''
+    Merges concurrent fetches into batches.
+
+    fetch - called as fetch(specs, key) with a list of object
+        specifications; returns one result per spec, in order.
+    window - the longest a queued fetch waits for the one in flight.
+    max_batch - a batch this large is fetched without waiting further.
+
+    Only specs submitted with the same key are merged, e.g. those of the
+    same caller with the same no_data flag, since get_objects2 applies both
+    to the whole call.
+    '''
+
+    def __init__(self, fetch, window=0.002, max_batch=100,
+                 clock=_time.monotonic):
+        if max_batch < 1:
+            raise ValueError('max_batch must be at least 1')
+        self._fetch = fetch
+        self._window = window
+        self._max_batch = max_batch
+        self._clock = clock
+        self._cond = _threading.Condition()
+        # key -> list of (spec, future) waiting to be fetched
+        self._pending = {}
+        # key -> the number of its fetches sent and not yet returned
+        self._in_flight = {}
+        self._batches = 0
+        self._objects = 0
+
+    def submit(self, spec, key=None):
+        ''' Fetch one object as part of a batch and return its result. '''
+        future = _Future()
+        ready = None
+        with self._cond:
+            batch = self._pending.setdefault(key, [])
+            batch.append((spec, future))
+            leader = len(batch) == 1
+            if len(batch) >= self._max_batch:
+                ready = self._take(key)
+            elif leader:
+                deadline = self._clock() + self._window
+                while self._pending.get(key) is batch:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0 or not self._in_flight.get(key):
+                        ready = self._take(key)
+                        break
+                    self._cond.wait(remaining)
+        if ready is not None:
+            self._dispatch(ready, key)
+        return future.result()
+
+    def stats(self):
+        with self._cond:
+            return {'batches': self._batches, 'objects': self._objects}
+
+    def _take(self, key):
+        # caller must hold the lock
+        batch = self._pending.pop(key)
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        self._batches += 1
+        self._objects += len(batch)
+        self._cond.notify_all()
+        return batch
+
+    def _dispatch(self, batch, key):
+        try:
+            results = self._fetch([spec for spec, _ in batch], key)
+            if len(results) != len(batch):
+                raise ValueError('Expected %d objects, got %d' %
+                                 (len(batch), len(results)))
+        except BaseException as e:
+            self._done(key)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self._done(key)
+        for (_, future), res in zip(batch, results):
+            future.set_result(res)
+
+    def _done(self, key):
+        with self._cond:
+            if self._in_flight[key] == 1:
+                del self._in_flight[key]
+            else:
+                self._in_flight[key] -= 1
+            # wakes the caller queued behind this fetch
+            self._cond.notify_all()
@@ -0,0 +1,141 @@
+'''
+A bounded, thread safe object cache for the TaxonAPI server.
+
+Entries are evicted least recently used first once the configured byte
+budget is exceeded. Objects fetched by a versioned reference never change,
+so they may be kept indefinitely; objects fetched by an unversioned
+reference (e.g. ReferenceTaxons/45157_taxon) can change when a new version
+is saved and are expired after a short TTL.
+
+An optional shared store (see TaxonAPI.sharedcache) acts as a second level
+for versioned entries, shared by every worker process on the node. Entries
+not everyone may read are kept out of it.
+'''
+import json as _json
+import threading as _threading
+import time as _time
+from collections import OrderedDict as _OrderedDict
+
+
+def is_versioned_ref(ref):
+    '''
+    True if every step of the (possibly chained) reference names an exact
+    object version, e.g. '1779/42/1' or 'ReferenceTaxons/1_taxon/1'.
+    '''
+    for step in ref.split(';'):
+        pieces = step.strip().split('/')
+        if len(pieces) != 3 or not pieces[2].isdigit():
+            return False
+    return True
+
+
+def estimate_size(value):
+    ''' Approximate the memory held by a cached value by its JSON size. '''
+    return len(_json.dumps(value, default=str))
+
+
+class ObjectCache(object):
+    '''
+    An LRU cache bounded by an approximate size in bytes, with separate
+    expiry policies for versioned and unversioned entries.
+
+    A TTL of None or 0 means entries of that kind never expire. If a shared
+    store is given, versioned entries are also written to it, and misses
+    are looked up in it before being reported, unless the get or put is
+    made with shared=False.
+    '''
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, versioned_ttl=None,
+                 unversioned_ttl=300, clock=_time.monotonic, shared=None):
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+        self._max_bytes = max_bytes
+        self._ttl = {True: versioned_ttl or None,
+                     False: unversioned_ttl or None}
+        self._clock = clock
+        self._shared = shared
+        self._lock = _threading.Lock()
+        # key -> [value, size, expires_at]
+        self._entries = _OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, shared=True):
+        '''
+        Return the cached value for key, or None if absent or expired.
+        shared - False to look in this process only.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] is None or entry[2] > self._clock():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                self._remove(key)
+                self._expirations += 1
+            self._misses += 1
+        if self._shared is None or not shared:
+            return None
+        value = self._shared.get(key)
+        if value is not None:
+            self._store(key, value, True)
+        return value
+
+    def put(self, key, value, versioned=False, shared=True):
+        '''
+        Cache value under key using the versioned or unversioned policy.
+        shared - False to keep the value in this process only, e.g. one
+            that only some callers may read.
+        '''
+        self._store(key, value, versioned)
+        if versioned and shared and self._shared is not None:
+            self._shared.put(key, value)
+
+    def _store(self, key, value, versioned):
+        size = estimate_size(value)
+        if size > self._max_bytes:
+            return
+        ttl = self._ttl[bool(versioned)]
+        expires_at = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = [value, size, expires_at]
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        ''' Return hit/miss/eviction counters and current usage. '''
+        with self._lock:
+            stats = {'hits': self._hits,
+                     'misses': self._misses,
+                     'evictions': self._evictions,
+                     'expirations': self._expirations,
+                     'entries': len(self._entries),
+                     'bytes': self._bytes,
+                     'max_bytes': self._max_bytes}
+        if self._shared is not None:
+            stats['shared'] = self._shared.stats()
+        return stats
+
+    def _remove(self, key):
+        # caller must hold the lock
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
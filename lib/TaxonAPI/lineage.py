@@ -0,0 +1,129 @@
+'''
+An in-process index of taxon ancestry.
+
+Each versioned taxon reference that has been walked is recorded with its
+scientific name and parent reference. Because ancestors are shared, one
+walk up from a leaf fills in the lineage of all its ancestors, and a later
+walk from a sibling stops as soon as it reaches a node that is already
+known. Versioned references are immutable, so entries never go stale.
+
+The index also maps scientific names to the refs seen with them, so that
+the ancestors listed in a taxon's scientific_lineage can be predicted and
+fetched together instead of one parent at a time.
+'''
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+
+from TaxonAPI.cache import is_versioned_ref
+
+
+class LineageIndex(object):
+    '''
+    Maps versioned taxon refs to their ordered ancestor list of
+    (ref, scientific_name) tuples, starting at the taxon itself and ending
+    at the root.
+
+    Complete lineages are memoized for the max_chains most recently used
+    refs; others are assembled from the parent pointers, which costs one
+    dict lookup per level but no workspace calls.
+
+    Each worker process holds its own index, at roughly 350 bytes per
+    taxon, so max_nodes is sized for several workers per node. Once full,
+    new taxa are not recorded and their lineages are walked as before.
+    '''
+
+    def __init__(self, max_nodes=500000, max_chains=10000):
+        self._max_nodes = max_nodes
+        self._max_chains = max_chains
+        self._lock = _threading.Lock()
+        # ref -> (scientific_name, parent_ref or None)
+        self._nodes = {}
+        self._chains = _OrderedDict()
+        # scientific_name -> ref, or None if several refs share the name
+        self._names = {}
+        self._hits = 0
+        self._misses = 0
+
+    def add(self, ref, scientific_name, parent_ref):
+        ''' Record a taxon. Unversioned refs are ignored. '''
+        if not is_versioned_ref(ref):
+            return
+        if parent_ref and not is_versioned_ref(parent_ref):
+            return
+        with self._lock:
+            if ref in self._nodes or len(self._nodes) >= self._max_nodes:
+                return
+            self._nodes[ref] = (scientific_name, parent_ref or None)
+            self._add_name(ref, scientific_name)
+
+    def add_name(self, ref, scientific_name):
+        '''
+        Record the name of a taxon whose parent is not known yet, e.g. a
+        child listed by get_decorated_children. Unversioned refs are ignored.
+        '''
+        if not is_versioned_ref(ref):
+            return
+        with self._lock:
+            self._add_name(ref, scientific_name)
+
+    def ref_named(self, scientific_name):
+        ''' Return the only ref seen with this name, or None. '''
+        with self._lock:
+            return self._names.get(scientific_name)
+
+    def node(self, ref):
+        ''' Return (scientific_name, parent_ref) for an indexed ref, or None. '''
+        with self._lock:
+            return self._nodes.get(ref)
+
+    def __contains__(self, ref):
+        with self._lock:
+            return ref in self._nodes
+
+    def lineage(self, ref):
+        '''
+        Return the list of (ref, scientific_name) from ref up to the root,
+        or None if ref or any of its ancestors is not yet indexed.
+        '''
+        with self._lock:
+            chain = self._chains.get(ref)
+            if chain is not None:
+                self._chains.move_to_end(ref)
+                self._hits += 1
+                return list(chain)
+            chain = []
+            current = ref
+            while current:
+                known = self._chains.get(current)
+                if known is not None:
+                    chain.extend(known)
+                    break
+                node = self._nodes.get(current)
+                if node is None:
+                    self._misses += 1
+                    return None
+                chain.append((current, node[0]))
+                current = node[1]
+            self._hits += 1
+            self._chains[ref] = tuple(chain)
+            if len(self._chains) > self._max_chains:
+                self._chains.popitem(last=False)
+            return chain
+
+    def stats(self):
+        with self._lock:
+            return {'nodes': len(self._nodes),
+                    'names': len(self._names),
+                    'chains': len(self._chains),
+                    'hits': self._hits,
+                    'misses': self._misses}
+
+    def _add_name(self, ref, scientific_name):
+        # caller must hold the lock
+        if not scientific_name:
+            return
+        if scientific_name in self._names:
+            if self._names[scientific_name] != ref:
+                self._names[scientific_name] = None
+        elif len(self._names) < self._max_nodes:
+            self._names[scientific_name] = ref
@@ -0,0 +1,375 @@
+'''
+Request and workspace call metrics, in the Prometheus text format.
+
+Every server method call is timed (Metrics.request), and every workspace
+call made through the shared requests session is counted and timed by a
+response hook (Metrics.workspace_response). Workspace calls are also added
+to the tally of the request being served, giving the number of workspace
+calls and bytes each method costs. The tally is kept in a context variable;
+work handed to another thread must be wrapped with propagate() to count
+towards the request. A fetch merged into another request's batch counts
+towards the request that made the call.
+
+A request can also be traced: its tally then records each workspace call
+with the refs it asked for, the bytes returned and its timing.
+trace_header fits a trace into a response header.
+
+Metrics are kept per process. Under uwsgi each worker process reports its
+own numbers.
+'''
+import contextlib as _contextlib
+import contextvars as _contextvars
+import json as _json
+import re as _re
+import threading as _threading
+import time as _time
+
+# request seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30)
+# workspace calls per request
+CALL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+# limits on the size of the trace of one method call
+MAX_TRACE_CALLS = 100
+MAX_TRACE_REFS = 5
+# proxies commonly reject responses with headers over 4 or 8 KB in all
+MAX_TRACE_HEADER_BYTES = 2048
+# stats that only ever go up, e.g. cache hits; the others, such as entries
+# or bytes, are current values
+COUNTER_STATS = frozenset(['hits', 'misses', 'evictions', 'expirations',
+                           'writes', 'errors', 'calls', 'shared', 'batches',
+                           'objects'])
+
+_current = _contextvars.ContextVar('taxonapi_request', default=None)
+
+# the generated clients put the method first in the request body
+_METHOD_RE = _re.compile(rb'"method":\s*"([^"]+)"')
+
+
+class RequestTally(object):
+    '''
+    The workspace calls made while serving one request.
+
+    method - the server method being served.
+    trace - if true, record each call as well as counting it.
+    '''
+
+    def __init__(self, method, trace=False, clock=_time.perf_counter):
+        self.method = method
+        self.calls = 0
+        self.bytes = 0
+        self.seconds = None
+        self.trace = [] if trace else None
+        self._dropped = 0
+        self._clock = clock
+        self._started = clock()
+        self._lock = _threading.Lock()
+
+    def add(self, ws_method, seconds, nbytes, body=None):
+        call = None
+        if self.trace is not None:
+            refs = request_refs(body)
+            call = {'method': ws_method,
+                    'refs': refs[:MAX_TRACE_REFS],
+                    'nrefs': len(refs),
+                    'bytes': nbytes,
+                    'start_ms': _ms(self._clock() - self._started - seconds),
+                    'ms': _ms(seconds)}
+        with self._lock:
+            self.calls += 1
+            self.bytes += nbytes
+            if call is not None:
+                if len(self.trace) < MAX_TRACE_CALLS:
+                    self.trace.append(call)
+                else:
+                    self._dropped += 1
+
+    def summary(self):
+        ''' The method, its time and its workspace calls, as a dict. '''
+        with self._lock:
+            summary = {'method': self.method,
+                       'ms': _ms(self.seconds or 0),
+                       'workspace_calls': self.calls,
+                       'bytes': self.bytes}
+            if self.trace is not None:
+                summary['calls'] = list(self.trace)
+                summary['calls_not_shown'] = self._dropped
+            return summary
+
+
+def trace_header(trace, max_bytes=MAX_TRACE_HEADER_BYTES):
+    '''
+    The JSON of a trace, a list of RequestTally summaries, in at most
+    max_bytes. If it does not fit, the workspace calls of each summary are
+    left out and the summary is marked "truncated"; then summaries are left
+    out from the end, and a final {"truncated": true, "not_shown": n} says
+    how many.
+    '''
+    header = _json.dumps(trace)
+    if len(header) <= max_bytes:
+        return header
+    shown = [dict(((k, v) for k, v in summary.items()
+                   if k not in ('calls', 'calls_not_shown')), truncated=True)
+             for summary in trace]
+    not_shown = []
+    while True:
+        header = _json.dumps(shown + not_shown)
+        if len(header) <= max_bytes or not shown:
+            return header
+        shown.pop()
+        not_shown = [{'truncated': True,
+                      'not_shown': len(trace) - len(shown)}]
+
+
+def current_tally():
+    ''' The tally of the request served by this thread, or None. '''
+    return _current.get()
+
+
+def propagate(fn):
+    '''
+    Wrap fn so that workspace calls it makes on another thread count
+    towards the current request.
+    '''
+    tally = _current.get()
+    if tally is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(tally)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+class Histogram(object):
+    ''' Counts of observed values at or below each bucket bound. '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # caller must hold the Metrics lock
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield name + '_bucket', dict(labels, le=_number(bound)), cumulative
+        yield name + '_bucket', dict(labels, le='+Inf'), self.count
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class Metrics(object):
+    '''
+    The request and workspace call metrics of one server process.
+
+    clock - returns seconds; used to time requests.
+    '''
+
+    def __init__(self, clock=_time.perf_counter):
+        self._clock = clock
+        self._lock = _threading.Lock()
+        self._started = _time.time()
+        # server method -> Histogram of seconds
+        self._requests = {}
+        self._errors = {}
+        # server method -> Histogram of workspace calls per request
+        self._request_calls = {}
+        self._request_bytes = {}
+        # workspace method -> Histogram of seconds
+        self._ws_calls = {}
+        self._ws_bytes = {}
+
+    @_contextlib.contextmanager
+    def request(self, method, trace=False):
+        '''
+        Time the body of the with statement as a call of method and tally
+        the workspace calls made meanwhile, recording each of them if trace
+        is true. Yields the RequestTally.
+        '''
+        tally = RequestTally(method, trace=trace, clock=self._clock)
+        token = _current.set(tally)
+        start = self._clock()
+        failed = True
+        try:
+            yield tally
+            failed = False
+        finally:
+            _current.reset(token)
+            tally.seconds = self._clock() - start
+            self.observe_request(method, tally.seconds, failed, tally)
+
+    def observe_request(self, method, seconds, failed=False, tally=None):
+        with self._lock:
+            _histogram(self._requests, method, REQUEST_BUCKETS).observe(
+                seconds)
+            if failed:
+                self._errors[method] = self._errors.get(method, 0) + 1
+            if tally is not None:
+                _histogram(self._request_calls, method,
+                           CALL_COUNT_BUCKETS).observe(tally.calls)
+                self._request_bytes[method] = (
+                    self._request_bytes.get(method, 0) + tally.bytes)
+
+    def workspace_response(self, response, *args, **kwargs):
+        '''
+        A requests response hook; add with
+        session.hooks['response'].append(metrics.workspace_response)
+        '''
+        ws_method = workspace_method(response.request.body)
+        seconds = response.elapsed.total_seconds()
+        nbytes = len(response.content)
+        with self._lock:
+            _histogram(self._ws_calls, ws_method, REQUEST_BUCKETS).observe(
+                seconds)
+            self._ws_bytes[ws_method] = (
+                self._ws_bytes.get(ws_method, 0) + nbytes)
+        tally = _current.get()
+        if tally is not None:
+            tally.add(ws_method, seconds, nbytes, response.request.body)
+
+    def render(self, stats=None):
+        '''
+        Return the metrics in the Prometheus text exposition format.
+
+        stats - a dict of further values to report, such as cache
+            statistics; nested dicts are flattened into names joined by _.
+            Those named in COUNTER_STATS are reported as counters, with a
+            _total suffix, and the rest as gauges.
+        '''
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for sample, labels, value in samples:
+                lines.append('%s%s %s' % (sample, _labels(labels),
+                                          _number(value)))
+
+        with self._lock:
+            family('taxonapi_request_seconds', 'histogram',
+                   'Time taken to serve a method call.',
+                   _histogram_samples('taxonapi_request_seconds',
+                                      self._requests, 'method'))
+            family('taxonapi_request_errors_total', 'counter',
+                   'Method calls that failed.',
+                   _counter_samples('taxonapi_request_errors_total',
+                                    self._errors, 'method'))
+            family('taxonapi_request_workspace_calls', 'histogram',
+                   'Workspace calls made to serve a method call.',
+                   _histogram_samples('taxonapi_request_workspace_calls',
+                                      self._request_calls, 'method'))
+            family('taxonapi_request_workspace_bytes_total', 'counter',
+                   'Bytes received from the workspace to serve method calls.',
+                   _counter_samples('taxonapi_request_workspace_bytes_total',
+                                    self._request_bytes, 'method'))
+            family('taxonapi_workspace_call_seconds', 'histogram',
+                   'Time taken by workspace calls.',
+                   _histogram_samples('taxonapi_workspace_call_seconds',
+                                      self._ws_calls, 'ws_method'))
+            family('taxonapi_workspace_bytes_total', 'counter',
+                   'Bytes received from the workspace.',
+                   _counter_samples('taxonapi_workspace_bytes_total',
+                                    self._ws_bytes, 'ws_method'))
+        family('taxonapi_process_start_time_seconds', 'gauge',
+               'Start time of the process since the epoch.',
+               [('taxonapi_process_start_time_seconds', {}, self._started)])
+        for name, value in sorted(_flatten('taxonapi', stats or {})):
+            help_text = name[len('taxonapi_'):].replace('_', ' ')
+            if name.rsplit('_', 1)[-1] in COUNTER_STATS:
+                name += '_total'
+                family(name, 'counter', help_text, [(name, {}, value)])
+            else:
+                family(name, 'gauge', help_text, [(name, {}, value)])
+        return '\n'.join(lines) + '\n'
+
+
+def workspace_method(body):
+    ''' The method named by the body of a workspace request. '''
+    body = (body or b'')[:200]
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    match = _METHOD_RE.search(body)
+    return match.group(1).decode('utf-8') if match else 'unknown'
+
+
+def request_refs(body):
+    '''
+    The object refs named anywhere in the params of a workspace request,
+    e.g. those of get_objects2 or list_referencing_objects.
+    '''
+    try:
+        params = _json.loads(body)['params']
+    except (TypeError, ValueError, KeyError):
+        return []
+    refs = []
+    stack = [params]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if isinstance(value.get('ref'), str):
+                refs.append(value['ref'])
+            stack.extend(reversed([v for k, v in value.items()
+                                   if k != 'ref']))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+    return refs
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def _histogram(histograms, key, buckets):
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram(buckets)
+    return histogram
+
+
+def _histogram_samples(name, histograms, label):
+    for key in sorted(histograms):
+        for sample in histograms[key].samples(name, {label: key}):
+            yield sample
+
+
+def _counter_samples(name, counters, label):
+    for key in sorted(counters):
+        yield name, {label: key}, counters[key]
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = prefix + '_' + _re.sub(r'[^a-zA-Z0-9_]', '_', str(key))
+        if isinstance(value, dict):
+            for item in _flatten(name, value):
+                yield item
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in sorted(labels.items()))
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return '%d' % value
+    return str(value)
@@ -0,0 +1,134 @@
+'''
+A node-local object store shared by all uwsgi worker processes.
+
+Only immutable entries (objects fetched by a versioned reference) are
+written here, so there is nothing to invalidate: any worker on the node
+can serve an object another worker already fetched, and the data outlives
+worker restarts. For the same reason only objects anyone may read are
+written; private ones stay in the cache of the process that fetched them.
+The store is a single SQLite file in WAL mode, which allows concurrent
+readers in many processes alongside one writer.
+
+Errors from the store are never fatal; a failed read is a miss and a
+failed write is dropped. The constructor raises OSError or sqlite3.Error
+if the file cannot be created or opened, in which case TaxonAPI runs with
+the in-process cache only.
+'''
+import json as _json
+import logging as _logging
+import os as _os
+import sqlite3 as _sqlite3
+import threading as _threading
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+'''
+_PRUNE_CHECK_INTERVAL = 1000  # writes between size checks
+
+
+class SharedObjectStore(object):
+    '''
+    A SQLite backed key/value store of JSON serializable cache entries.
+
+    Keys are the tuples used by TaxonAPI.cache.ObjectCache. Once the file
+    grows past max_bytes the oldest tenth of the entries is deleted.
+    '''
+
+    def __init__(self, path, max_bytes=4 * 1024 * 1024 * 1024, timeout=5):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._timeout = timeout
+        self._local = _threading.local()
+        self._lock = _threading.Lock()
+        self._writes = 0
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._logger = _logging.getLogger(__name__)
+        directory = _os.path.dirname(path)
+        if directory:
+            _os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        # only takes effect when the file is first created
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(_SCHEMA)
+        conn.commit()
+
+    def get(self, key):
+        ''' Return the stored value for key, or None. '''
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM objects WHERE key = ?',
+                (self._encode_key(key),)).fetchone()
+        except _sqlite3.Error as e:
+            self._error('read', e)
+            return None
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return _json.loads(row[0])
+
+    def put(self, key, value):
+        ''' Store value under key. Existing entries are left untouched. '''
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR IGNORE INTO objects (key, value) VALUES (?, ?)',
+                (self._encode_key(key), _json.dumps(value)))
+            conn.commit()
+        except _sqlite3.Error as e:
+            self._error('write', e)
+            return
+        with self._lock:
+            self._writes += 1
+            check = self._writes % _PRUNE_CHECK_INTERVAL == 0
+        if check:
+            self._prune()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'writes': self._writes,
+                    'errors': self._errors}
+
+    def _prune(self):
+        try:
+            conn = self._connection()
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            if page_count * page_size <= self._max_bytes:
+                return
+            conn.execute(
+                'DELETE FROM objects WHERE rowid IN (SELECT rowid FROM objects '
+                'ORDER BY rowid LIMIT (SELECT COUNT(*) / 10 + 1 FROM objects))')
+            conn.commit()
+            conn.execute('PRAGMA incremental_vacuum')
+        except _sqlite3.Error as e:
+            self._error('prune', e)
+
+    def _connection(self):
+        # sqlite connections may not be shared between threads, nor survive
+        # the fork of a uwsgi worker from the master process
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != _os.getpid():
+            conn = _sqlite3.connect(self._path, timeout=self._timeout)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = _os.getpid()
+        return conn
+
+    def _encode_key(self, key):
+        return _json.dumps(key, separators=(',', ':'))
+
+    def _error(self, action, e):
+        with self._lock:
+            self._errors += 1
+        self._logger.warning('Shared cache %s failed for %s: %s',
+                             action, self._path, e)
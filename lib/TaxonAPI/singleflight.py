@@ -0,0 +1,52 @@
+'''
+Coalescing of concurrent identical calls.
+
+When several server threads miss the cache for the same object at the same
+time (after a restart, a TTL expiry, or when many clients expand the same
+tree node) only the first of them calls the workspace; the others wait for
+and share its result, or its exception.
+'''
+import threading as _threading
+from concurrent.futures import Future as _Future
+
+
+class SingleFlight(object):
+    '''
+    Runs at most one call per key at a time. Callers that arrive while a
+    call for their key is in flight get that call's outcome instead of
+    making their own.
+    '''
+
+    def __init__(self):
+        self._lock = _threading.Lock()
+        self._calls = {}
+        self._calls_made = 0
+        self._shared = 0
+
+    def do(self, key, fn):
+        ''' Return fn(), or the result of an in-flight call for key. '''
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = _Future()
+                self._calls[key] = future
+                self._calls_made += 1
+            else:
+                self._shared += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self._calls_made,
+                    'shared': self._shared,
+                    'in_flight': len(self._calls)}
@@ -0,0 +1,506 @@
+'''
+A local, read only snapshot of a taxonomy workspace such as ReferenceTaxons.
+
+The NCBI taxonomy has millions of Taxon objects but changes rarely, so the
+server can load a snapshot of the whole workspace at startup and answer
+reads for the refs it covers without calling the workspace at all.
+
+Snapshots are exported by export_workspace (see
+scripts/export_taxonomy_snapshot.py) as JSON lines, one get_objects2 result
+({"info": [...], "data": {...}}) per Taxon object, latest versions only.
+Unversioned refs resolve to the version held in the snapshot.
+
+A snapshot is never updated: objects saved to the workspace after it was
+exported, including new children of the taxa in it, are not in it until
+it is exported and built again.
+
+For production use a snapshot is converted once into an index file
+(TaxonomySnapshot.write, scripts/build_taxonomy_index.py) that every server
+process memory maps at startup. The index file layout is:
+
+    8 bytes    magic, b'TAXIDX01'
+    4 bytes    little endian length of the header
+    header     UTF-8 JSON: workspace, byte order, sparse fields and the
+               offset, typecode and length of every section
+    sections   raw arrays, each starting on an 8 byte boundary
+
+The sections are the per-taxon columns below plus the string blob and its
+offsets, the alias and children CSR arrays, the object name order and the
+taxonomy id hash table. Loading casts memoryviews over the mapping, so no
+data is copied or parsed, and all processes on a node share the same pages
+through the OS page cache.
+'''
+import json as _json
+import mmap as _mmap
+import struct as _struct
+import sys as _sys
+from array import array as _array
+from bisect import bisect_left as _bisect_left
+
+_TAXON_TYPE = 'KBaseGenomeAnnotations.Taxon'
+
+# Per-taxon columns and their array typecodes. Columns ending in _sid hold
+# ids into the snapshot's string table, or -1 for a missing value. Missing
+# integers are also stored as -1.
+_COLUMNS = [
+    ('object_id', 'q'),
+    ('version', 'i'),
+    ('parent', 'i'),
+    ('taxonomy_id', 'i'),
+    ('genetic_code', 'b'),
+    ('size', 'q'),
+    ('object_name_sid', 'i'),
+    ('type_string_sid', 'i'),
+    ('save_date_sid', 'i'),
+    ('saved_by_sid', 'i'),
+    ('checksum_sid', 'i'),
+    ('scientific_name_sid', 'i'),
+    ('scientific_lineage_sid', 'i'),
+    ('rank_sid', 'i'),
+    ('kingdom_sid', 'i'),
+    ('domain_sid', 'i'),
+]
+_STRING_FIELDS = ['scientific_name', 'scientific_lineage', 'rank', 'kingdom',
+                  'domain']
+
+_MAGIC = b'TAXIDX01'
+_FORMAT_VERSION = 1
+_ALIGN = 8
+_HASH_MULTIPLIER = 2654435761
+
+
+def export_workspace(ws, workspace, out, page_size=10000, batch_size=1000):
+    '''
+    Write every Taxon object in workspace to the file object out as JSON
+    lines, paging through list_objects by object id.
+    Returns the number of taxa written.
+    '''
+    count = 0
+    min_id = 1
+    while True:
+        infos = ws.list_objects({'workspaces': [workspace],
+                                 'type': _TAXON_TYPE,
+                                 'minObjectID': min_id,
+                                 'includeMetadata': 1,
+                                 'limit': page_size})
+        if not infos:
+            break
+        infos.sort(key=lambda i: i[0])
+        for start in range(0, len(infos), batch_size):
+            refs = ['%d/%d/%d' % (i[6], i[0], i[4])
+                    for i in infos[start:start + batch_size]]
+            objs = ws.get_objects2({
+                'objects': [{'ref': ref} for ref in refs]
+            })['data']
+            for obj in objs:
+                out.write(_json.dumps({'info': obj['info'],
+                                       'data': obj['data']}) + '\n')
+                count += 1
+        if len(infos) < page_size:
+            break
+        min_id = infos[-1][0] + 1
+    return count
+
+
+class StringTable(object):
+    '''
+    Interned strings stored back to back in one UTF-8 blob and addressed by
+    integer id, so that millions of names cost no per-string object.
+    '''
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def get(self, sid):
+        if sid < 0:
+            return None
+        return str(self._blob[self._offsets[sid]:self._offsets[sid + 1]],
+                   'utf-8')
+
+
+class TaxonomySnapshot(object):
+    '''
+    The Taxon objects of a single workspace, held as parallel arrays.
+
+    Taxa are stored in object id order, so index_of finds an object id by
+    bisection, and an object name through the name_order column. Strings
+    are interned in a StringTable and aliases are stored in compressed
+    sparse row form: the alias string ids of taxon i are
+    alias_sids[alias_offsets[i]:alias_offsets[i + 1]].
+
+    get_object returns objects shaped like get_objects2 results, so callers
+    can use a snapshot anywhere they would otherwise call the workspace.
+    '''
+
+    def __init__(self, workspace_id, workspace_name, columns,
+                 metadata=None, external_parents=None, mapping=None):
+        self.workspace_id = workspace_id
+        self.workspace_name = workspace_name
+        self.columns = columns
+        self.strings = StringTable(columns['string_blob'],
+                                   columns['string_offsets'])
+        for name, _ in _COLUMNS:
+            setattr(self, '_' + name, columns[name])
+        self._alias_offsets = columns['alias_offsets']
+        self._alias_sids = columns['alias_sids']
+        self._child_offsets = columns['child_offsets']
+        self._child_indices = columns['child_indices']
+        self._name_order = columns['name_order']
+        self._taxid_hash = columns['taxid_hash']
+        # sparse: object metadata and parents outside the snapshot, by index
+        self._metadata = metadata or {}
+        self._external_parents = external_parents or {}
+        # keeps a memory mapped index file open
+        self._mapping = mapping
+
+    @classmethod
+    def load(cls, path):
+        ''' Load an index file, or a JSON lines snapshot. '''
+        with open(path, 'rb') as f:
+            magic = f.read(len(_MAGIC))
+        if magic == _MAGIC:
+            return cls.load_index(path)
+        return cls.load_jsonl(path)
+
+    @classmethod
+    def load_index(cls, path):
+        ''' Memory map an index file written by write. '''
+        with open(path, 'rb') as f:
+            mapping = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        if bytes(view[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError('%s is not a taxonomy index file' % path)
+        start = len(_MAGIC) + 4
+        header_len = _struct.unpack('<I', view[len(_MAGIC):start])[0]
+        header = _json.loads(str(view[start:start + header_len], 'utf-8'))
+        if header['format_version'] != _FORMAT_VERSION:
+            raise ValueError('Unsupported taxonomy index format %s in %s' %
+                             (header['format_version'], path))
+        if header['byteorder'] != _sys.byteorder:
+            raise ValueError('Taxonomy index %s was written on a %s endian '
+                             'machine' % (path, header['byteorder']))
+        columns = {}
+        for name, (typecode, offset, nbytes) in header['sections'].items():
+            columns[name] = view[offset:offset + nbytes].cast(typecode)
+        return cls(header['workspace_id'], header['workspace_name'], columns,
+                   {int(k): v for k, v in header['metadata'].items()},
+                   {int(k): v for k, v in header['external_parents'].items()},
+                   mapping)
+
+    def write(self, path):
+        ''' Write this snapshot as an index file for load_index. '''
+        relative = {}
+        offset = 0
+        for name in sorted(self.columns):
+            column = memoryview(self.columns[name])
+            relative[name] = (column.format, offset, column.nbytes)
+            offset = _align(offset + column.nbytes)
+        header = {'format_version': _FORMAT_VERSION,
+                  'byteorder': _sys.byteorder,
+                  'workspace_id': self.workspace_id,
+                  'workspace_name': self.workspace_name,
+                  'count': len(self),
+                  'metadata': self._metadata,
+                  'external_parents': self._external_parents}
+        # the section offsets depend on the header size and vice versa, so
+        # grow the space reserved for the header until it fits
+        data_start = 0
+        while True:
+            sections = {name: [fmt, data_start + off, nbytes]
+                        for name, (fmt, off, nbytes) in relative.items()}
+            header['sections'] = sections
+            header_bytes = _json.dumps(header).encode('utf-8')
+            needed = _align(len(_MAGIC) + 4 + len(header_bytes))
+            if needed <= data_start:
+                break
+            data_start = needed
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(_struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for name in sorted(self.columns):
+                f.seek(sections[name][1])
+                f.write(memoryview(self.columns[name]).cast('B'))
+
+    @classmethod
+    def load_jsonl(cls, path):
+        ''' Load a snapshot written by export_workspace. '''
+        builder = None
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                obj = _json.loads(line)
+                info = obj['info']
+                if builder is None:
+                    builder = _SnapshotBuilder(info[6], info[7])
+                elif info[6] != builder.workspace_id:
+                    raise ValueError(
+                        'Taxonomy snapshot %s mixes workspaces %s and %s' %
+                        (path, builder.workspace_id, info[6]))
+                builder.add(info, obj['data'])
+        if builder is None:
+            raise ValueError('Taxonomy snapshot %s is empty' % path)
+        return builder.build()
+
+    def __len__(self):
+        return len(self._object_id)
+
+    def index_of(self, ref):
+        '''
+        Return the index of the taxon named by ref, or None if ref is not
+        covered by this snapshot.
+        '''
+        if ';' in ref:
+            return None
+        pieces = ref.split('/')
+        if len(pieces) not in (2, 3):
+            return None
+        if pieces[0] not in (str(self.workspace_id), self.workspace_name):
+            return None
+        if pieces[1].isdigit():
+            index = self._index_of_id(int(pieces[1]))
+        else:
+            index = self._index_of_name(pieces[1])
+        if index is None:
+            return None
+        if len(pieces) == 3 and pieces[2] != str(self._version[index]):
+            return None
+        return index
+
+    def upa(self, index):
+        ''' The versioned workspace reference of the taxon at index. '''
+        return '%d/%d/%d' % (self.workspace_id, self._object_id[index],
+                             self._version[index])
+
+    def parent(self, index):
+        ''' The index of the parent taxon, or -1 for the root. '''
+        return self._parent[index]
+
+    def parent_ref(self, index):
+        parent = self._parent[index]
+        if parent >= 0:
+            return self.upa(parent)
+        return self._external_parents.get(index)
+
+    def info(self, index):
+        ''' The workspace object_info tuple of the taxon at index. '''
+        s = self.strings
+        return [self._object_id[index],
+                s.get(self._object_name_sid[index]),
+                s.get(self._type_string_sid[index]),
+                s.get(self._save_date_sid[index]),
+                self._version[index],
+                s.get(self._saved_by_sid[index]),
+                self.workspace_id,
+                self.workspace_name,
+                s.get(self._checksum_sid[index]),
+                self._size[index],
+                self._metadata.get(index)]
+
+    def children(self, index):
+        ''' The indices of the child taxa of the taxon at index. '''
+        return list(self._child_indices[self._child_offsets[index]:
+                                        self._child_offsets[index + 1]])
+
+    def index_of_taxonomy_id(self, taxonomy_id):
+        ''' The index of the taxon with the given NCBI id, or None. '''
+        table = self._taxid_hash
+        mask = len(table) - 1
+        slot = (taxonomy_id * _HASH_MULTIPLIER) & mask
+        while table[slot] >= 0:
+            if self._taxonomy_id[table[slot]] == taxonomy_id:
+                return table[slot]
+            slot = (slot + 1) & mask
+        return None
+
+    def aliases(self, index):
+        start = self._alias_offsets[index]
+        end = self._alias_offsets[index + 1]
+        return [self.strings.get(self._alias_sids[i])
+                for i in range(start, end)]
+
+    def data(self, index, fields=None):
+        ''' The Taxon data of the taxon at index, optionally projected. '''
+        if fields is None:
+            fields = _STRING_FIELDS + ['taxonomy_id', 'genetic_code',
+                                       'aliases', 'parent_taxon_ref']
+        data = {}
+        for field in fields:
+            if field in _STRING_FIELDS:
+                sid = getattr(self, '_' + field + '_sid')[index]
+                value = self.strings.get(sid)
+            elif field in ('taxonomy_id', 'genetic_code'):
+                value = getattr(self, '_' + field)[index]
+                if value < 0:
+                    value = None
+            elif field == 'aliases':
+                value = self.aliases(index)
+            elif field == 'parent_taxon_ref':
+                value = self.parent_ref(index)
+            else:
+                value = None
+            if value is not None:
+                data[field] = value
+        return data
+
+    def get_object(self, ref, no_data=False, fields=None):
+        '''
+        Return ref as a get_objects2 result, or None if ref is not covered
+        by this snapshot.
+        '''
+        index = self.index_of(ref)
+        if index is None:
+            return None
+        obj = {'info': self.info(index), 'path': [self.upa(index)]}
+        if not no_data:
+            obj['data'] = self.data(index, fields)
+        return obj
+
+    def _index_of_id(self, object_id):
+        index = _bisect_left(self._object_id, object_id)
+        if index < len(self._object_id) and \
+                self._object_id[index] == object_id:
+            return index
+        return None
+
+    def _index_of_name(self, name):
+        order = self._name_order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.strings.get(self._object_name_sid[order[mid]]) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and \
+                self.strings.get(self._object_name_sid[order[lo]]) == name:
+            return order[lo]
+        return None
+
+
+class _SnapshotBuilder(object):
+    ''' Collects taxa and lays them out as TaxonomySnapshot columns. '''
+
+    def __init__(self, workspace_id, workspace_name):
+        self.workspace_id = workspace_id
+        self.workspace_name = workspace_name
+        self._rows = []
+
+    def add(self, info, data):
+        self._rows.append((info, data))
+
+    def build(self):
+        rows = sorted(self._rows, key=lambda r: r[0][0])
+        self._rows = []
+        sids = {}
+        strings = []
+
+        def intern(value):
+            if value is None:
+                return -1
+            sid = sids.get(value)
+            if sid is None:
+                sid = sids[value] = len(strings)
+                strings.append(value)
+            return sid
+
+        columns = {name: _array(code) for name, code in _COLUMNS}
+        columns['alias_offsets'] = _array('q', [0])
+        columns['alias_sids'] = _array('i')
+        metadata = {}
+        for index, (info, data) in enumerate(rows):
+            c = columns
+            c['object_id'].append(info[0])
+            c['version'].append(info[4])
+            c['parent'].append(-1)
+            c['taxonomy_id'].append(_int_or_missing(data.get('taxonomy_id')))
+            c['genetic_code'].append(
+                _int_or_missing(data.get('genetic_code')))
+            c['size'].append(info[9])
+            c['object_name_sid'].append(intern(info[1]))
+            c['type_string_sid'].append(intern(info[2]))
+            c['save_date_sid'].append(intern(info[3]))
+            c['saved_by_sid'].append(intern(info[5]))
+            c['checksum_sid'].append(intern(info[8]))
+            for field in _STRING_FIELDS:
+                c[field + '_sid'].append(intern(data.get(field)))
+            for alias in data.get('aliases') or []:
+                c['alias_sids'].append(intern(alias))
+            c['alias_offsets'].append(len(c['alias_sids']))
+            if info[10]:
+                metadata[index] = info[10]
+
+        offsets = _array('q', [0])
+        blob = bytearray()
+        for value in strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        columns['string_blob'] = _array('B', blob)
+        columns['string_offsets'] = offsets
+        columns['name_order'] = _array('i', sorted(
+            range(len(rows)), key=lambda i: rows[i][0][1]))
+        columns['taxid_hash'] = _taxid_hash(columns['taxonomy_id'])
+        # filled in once parents are linked
+        columns['child_offsets'] = _array('i', [0] * (len(rows) + 1))
+        columns['child_indices'] = _array('i')
+        snapshot = TaxonomySnapshot(
+            self.workspace_id, self.workspace_name, columns, metadata)
+
+        for index, (_, data) in enumerate(rows):
+            ref = data.get('parent_taxon_ref')
+            if not ref:
+                continue
+            parent = snapshot.index_of(ref)
+            if parent is None or len(ref.split('/')) != 3:
+                snapshot._external_parents[index] = ref
+            else:
+                columns['parent'][index] = parent
+        _fill_children(columns['parent'], columns['child_offsets'],
+                       columns['child_indices'])
+        return snapshot
+
+
+def _int_or_missing(value):
+    return -1 if value is None else value
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _taxid_hash(taxonomy_ids):
+    # open addressing with linear probing, at most half full
+    size = 1
+    while size < 2 * len(taxonomy_ids):
+        size *= 2
+    table = _array('i', [-1] * size)
+    mask = size - 1
+    for index, taxonomy_id in enumerate(taxonomy_ids):
+        if taxonomy_id < 0:
+            continue
+        slot = (taxonomy_id * _HASH_MULTIPLIER) & mask
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = index
+    return table
+
+
+def _fill_children(parents, child_offsets, child_indices):
+    # counting sort of taxa by parent; children stay in object id order
+    for parent in parents:
+        if parent >= 0:
+            child_offsets[parent + 1] += 1
+    for i in range(1, len(child_offsets)):
+        child_offsets[i] += child_offsets[i - 1]
+    child_indices.extend([0] * child_offsets[-1])
+    position = _array('i', child_offsets[:-1])
+    for index, parent in enumerate(parents):
+        if parent >= 0:
+            child_indices[position[parent]] = index
+            position[parent] += 1
@@ -0,0 +1,51 @@
+'''
+A process wide table of workspace type strings and their MD5 forms.
+
+Listing the referrers of a taxon yields type strings such as
+KBaseGenomes.Genome-8.0, which are grouped by their MD5 form. There are only
+a handful of distinct types, and a versioned type string always names the
+same definition, so each needs translating only once per process rather than
+once per request.
+'''
+import threading as _threading
+
+
+class TypeTable(object):
+    '''
+    Translates type strings with translate_to_MD5_types, remembering the
+    results for versioned types.
+
+    translate - called with a list of distinct type strings; returns a dict
+        of each to its MD5 form, as Workspace.translate_to_MD5_types does.
+    '''
+
+    def __init__(self, translate):
+        self._translate = translate
+        self._lock = _threading.Lock()
+        self._types = {}
+        self._calls = 0
+
+    def translate(self, types):
+        '''
+        Return a dict of each of types to its MD5 form, calling the
+        workspace only for those not yet known.
+        '''
+        types = list(dict.fromkeys(types))
+        with self._lock:
+            found = {t: self._types[t] for t in types if t in self._types}
+        missing = [t for t in types if t not in found]
+        if missing:
+            res = self._translate(missing)
+            with self._lock:
+                self._calls += 1
+                for t in missing:
+                    # an unversioned type means the latest version, which
+                    # can change
+                    if '-' in t:
+                        self._types[t] = res[t]
+            found.update((t, res[t]) for t in missing)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {'types': len(self._types), 'calls': self._calls}
@@ -0,0 +1,14 @@
+import sys
+
+from TaxonAPI.snapshot import TaxonomySnapshot
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: <program> <snapshot_file> <index_file>")
+        print("Converts a snapshot written by export_taxonomy_snapshot.py into")
+        print("the memory mapped index format for the taxonomy-snapshot-path")
+        print("config option.")
+        sys.exit(1)
+    snapshot = TaxonomySnapshot.load_jsonl(sys.argv[1])
+    snapshot.write(sys.argv[2])
+    print("Wrote index of %d taxa to %s" % (len(snapshot), sys.argv[2]))
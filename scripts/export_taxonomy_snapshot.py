@@ -0,0 +1,17 @@
+import os
+import sys
+
+from Workspace.WorkspaceClient import Workspace
+from TaxonAPI.snapshot import export_workspace
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("Usage: <program> <workspace_url> <workspace_name> <output_file>")
+        print("Writes every Taxon object in the workspace to <output_file> as a")
+        print("taxonomy snapshot for the taxonomy-snapshot-path config option.")
+        print("Set KB_AUTH_TOKEN if the workspace is not public.")
+        sys.exit(1)
+    ws = Workspace(sys.argv[1], token=os.environ.get('KB_AUTH_TOKEN'))
+    with open(sys.argv[3], 'w') as f:
+        count = export_workspace(ws, sys.argv[2], f)
+    print("Wrote %d taxa to %s" % (count, sys.argv[3]))
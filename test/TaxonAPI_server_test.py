@@ -1,3 +1,5 @@
+import io
+import json
 import unittest
 import time
 
@@ -6,7 +8,9 @@ from configparser import ConfigParser
 
 from biokbase.workspace.client import Workspace as workspaceService
 from TaxonAPI.TaxonAPIImpl import TaxonAPI
-from TaxonAPI.TaxonAPIServer import MethodContext
+from TaxonAPI.TaxonAPIServer import MethodContext, JSONRPCServiceCustom, \
+    application
+from concurrent.futures import ThreadPoolExecutor
 
 
 class taxon_apiTest(unittest.TestCase):
@@ -170,6 +174,148 @@ class taxon_apiTest(unittest.TestCase):
         ret = self.getImpl().get_aliases(self.getContext(), self.taxon)
         self.assertEqual(ret[0], [])
 
+    def test_get_batch(self):
+        refs = [self.taxon, self.root_taxon, self.taxon]
+        ret = self.getImpl().get_scientific_name_batch(self.getContext(), refs)
+        self.assertEqual(ret[0], [u'Cyanidioschyzon merolae strain 10D',
+                                  u'root',
+                                  u'Cyanidioschyzon merolae strain 10D'])
+        ret = self.getImpl().get_taxonomic_id_batch(self.getContext(), refs)
+        self.assertEqual(ret[0], [280699, 1, 280699])
+        ret = self.getImpl().get_parent_batch(self.getContext(), refs)
+        self.assertEqual(ret[0][1], '')
+        self.assertEqual(ret[0][0], self.getImpl().get_parent(self.getContext(), self.taxon)[0])
+        ret = self.getImpl().get_aliases_batch(self.getContext(), [self.taxon])
+        self.assertEqual(ret[0], [[]])
+        ret = self.getImpl().get_genetic_code_batch(self.getContext(), [])
+        self.assertEqual(ret[0], [])
+
+    def test_batch_request(self):
+        service = JSONRPCServiceCustom()
+        service.batch_pool = ThreadPoolExecutor(max_workers=4)
+        service.add(self.getImpl().get_scientific_name,
+                    name='TaxonAPI.get_scientific_name', types=[str])
+        refs = [self.taxon, self.root_taxon, self.taxon]
+        batch = [{'method': 'TaxonAPI.get_scientific_name', 'params': [ref],
+                  'version': '1.1', 'id': str(i)} for i, ref in enumerate(refs)]
+        ret = service.call_py(self.getContext(), batch)
+        self.assertEqual([r['id'] for r in ret], ['0', '1', '2'])
+        self.assertEqual([r['result'] for r in ret],
+                         [[u'Cyanidioschyzon merolae strain 10D'], [u'root'],
+                          [u'Cyanidioschyzon merolae strain 10D']])
+
+    def test_invalid_batch_members(self):
+        service = JSONRPCServiceCustom()
+        service.add(self.getImpl().get_scientific_name,
+                    name='TaxonAPI.get_scientific_name', types=[str])
+        batch = [{'method': 'TaxonAPI.get_scientific_name',
+                  'params': [self.root_taxon], 'version': '1.1', 'id': '0'},
+                 {'method': 'TaxonAPI.get_scientific_name', 'version': '1.1',
+                  'id': '1'},
+                 {'method': 'TaxonAPI.get_scientific_name', 'version': '1.1',
+                  'params': [self.root_taxon]},
+                 'not a request']
+        ret = service.call_py(self.getContext(), batch)
+        self.assertEqual(ret[0]['result'], [u'root'])
+        # the third is a notification, which is run but gets no response
+        self.assertEqual([r['id'] for r in ret], ['0', '1', None])
+        self.assertEqual([r['error']['code'] for r in ret[1:]],
+                         [-32600] * 2)
+
+    def test_batch_member_errors(self):
+        service = JSONRPCServiceCustom()
+        service.batch_pool = ThreadPoolExecutor(max_workers=4)
+        service.add(self.getImpl().get_scientific_name,
+                    name='TaxonAPI.get_scientific_name', types=[str])
+        refs = [self.taxon, 'ReferenceTaxons/no_such_taxon', self.root_taxon]
+        batch = [{'method': 'TaxonAPI.get_scientific_name', 'params': [ref],
+                  'version': '1.1', 'id': str(i)} for i, ref in enumerate(refs)]
+        ret = service.call_py(self.getContext(), batch)
+        self.assertEqual([r['id'] for r in ret], ['0', '1', '2'])
+        self.assertEqual(ret[0]['result'],
+                         [u'Cyanidioschyzon merolae strain 10D'])
+        self.assertEqual(ret[2]['result'], [u'root'])
+        self.assertNotIn('result', ret[1])
+        self.assertEqual(ret[1]['error']['code'], -32000)
+        self.assertIn('no_such_taxon', ret[1]['error']['message'])
+
+    def test_batch_notification(self):
+        service = JSONRPCServiceCustom()
+        names = []
+
+        def get_scientific_name(ctx, ref):
+            names.append(ref)
+            return self.getImpl().get_scientific_name(ctx, ref)
+        service.add(get_scientific_name,
+                    name='TaxonAPI.get_scientific_name', types=[str])
+        batch = [{'method': 'TaxonAPI.get_scientific_name',
+                  'params': [self.root_taxon], 'version': '1.1'},
+                 {'method': 'TaxonAPI.get_scientific_name',
+                  'params': [self.taxon], 'version': '1.1', 'id': '1'}]
+        ret = service.call_py(self.getContext(), batch)
+        self.assertEqual(sorted(names), sorted([self.root_taxon, self.taxon]))
+        self.assertEqual([r['id'] for r in ret], ['1'])
+        self.assertIsNone(service.call_py(self.getContext(), batch[:1]))
+
+    def test_invalid_requests(self):
+        def post(body):
+            body = json.dumps(body).encode('utf-8')
+            status = []
+            res = b''.join(application(
+                {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)),
+                 'wsgi.input': io.BytesIO(body), 'REMOTE_ADDR': '127.0.0.1',
+                 'PATH_INFO': '/'},
+                lambda s, headers: status.append(s)))
+            return status[0], json.loads(res)
+
+        for body in ([], {}, {'method': 'TaxonAPI.get_scientific_name',
+                              'version': '1.1'}, 5):
+            status, res = post(body)
+            self.assertTrue(status.startswith('500'))
+            self.assertEqual(res['error']['code'], -32600)
+        status, res = post([{'method': 'TaxonAPI.get_scientific_name',
+                             'version': '1.1', 'id': '1'}])
+        self.assertTrue(status.startswith('200'))
+        self.assertEqual(res[0]['error']['code'], -32600)
+
+    def test_get_children_page(self):
+        children = self.getImpl().get_children(self.getContext(), self.parent)[0]
+        refs = []
+        params = {'ref': self.parent, 'limit': 1}
+        while True:
+            page = self.getImpl().get_children_page(self.getContext(), params)[0]
+            self.assertEqual(page['count'], len(children))
+            refs.extend(page['refs'])
+            if not page['next_cursor']:
+                break
+            params['cursor'] = page['next_cursor']
+        self.assertEqual(sorted(refs), sorted(children))
+        count = self.getImpl().get_children_page(self.getContext(), {
+            'ref': self.parent, 'count_only': 1})[0]
+        self.assertEqual(count, {'refs': [], 'count': len(children),
+                                 'next_cursor': ''})
+
+    def test_get_subtree(self):
+        children = self.getImpl().get_children(self.getContext(), self.parent)[0]
+        ret = self.getImpl().get_subtree(self.getContext(), {
+            'ref': self.parent, 'max_depth': 1, 'fields': ['scientific_name']})[0]
+        self.assertEqual([t['ref'] for t in ret['taxa']], sorted(
+            children, key=lambda r: [int(i) for i in r.split('/')]))
+        self.assertEqual(ret['truncated'], 0)
+        self.assertEqual(set(t['depth'] for t in ret['taxa']), {1})
+        self.assertIn({'scientific_name': u'Cyanidioschyzon merolae strain 10D'},
+                      [t['data'] for t in ret['taxa']])
+        ret = self.getImpl().get_subtree(self.getContext(), {
+            'ref': self.parent, 'max_depth': 1, 'limit': 1})[0]
+        self.assertEqual(len(ret['taxa']), 1)
+        if len(children) > 1:
+            rest = self.getImpl().get_subtree(self.getContext(), {
+                'ref': self.parent, 'max_depth': 1,
+                'cursor': ret['next_cursor']})[0]
+            self.assertEqual([t['ref'] for t in ret['taxa'] + rest['taxa']],
+                             sorted(children, key=lambda r: [
+                                 int(i) for i in r.split('/')]))
+
     def test_get_info(self):
         ret = self.getImpl().get_info(self.getContext(), self.taxon)
         ws_id, obj_id, version = self.wsClient.get_objects2({'objects': [{'ref': self.taxon}]})['data'][0]['path'][0].split('/')
@@ -0,0 +1,175 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from fakeworkspace import FakeWorkspace, SyntheticTaxonomy, TAXON_WS, \
+    serve, write_snapshot
+from TaxonAPI.access import WorkspaceClients
+from TaxonAPI.TaxonAPIImpl import TaxonAPI
+from Workspace.baseclient import ServerError
+
+ALICE = {'token': 'token-a', 'user_id': 'alice'}
+BOB = {'token': 'token-b', 'user_id': 'bob'}
+ANONYMOUS = {}
+
+
+class WorkspaceClientsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = WorkspaceClients('https://kbase.us/services/ws',
+                                        max_clients=2)
+
+    def test_anonymous(self):
+        for ctx in (None, {}, {'token': None}):
+            access = self.clients.for_context(ctx)
+            self.assertIs(access, self.clients.anonymous)
+        self.assertIsNone(access.scope)
+        self.assertEqual(access.private_scope, ('anonymous',))
+
+    def test_clients_are_reused_per_token(self):
+        alice = self.clients.for_context({'token': 'a', 'user_id': 'alice'})
+        bob = self.clients.for_context({'token': 'b', 'user_id': 'bob'})
+        self.assertIsNot(alice.ws, bob.ws)
+        self.assertEqual(alice.scope, ('user', 'alice'))
+        self.assertEqual(alice.private_scope, ('user', 'alice'))
+        self.assertIs(self.clients.for_context({'token': 'a',
+                                                'user_id': 'alice'}), alice)
+
+    def test_unvalidated_token_gets_its_own_scope(self):
+        access = self.clients.for_context({'token': 'secret'})
+        self.assertEqual(access.scope[0], 'token')
+        self.assertNotIn('secret', access.scope[1])
+        other = self.clients.for_context({'token': 'other'})
+        self.assertNotEqual(access.scope, other.scope)
+
+    def test_least_recently_used_client_is_dropped(self):
+        first = self.clients.for_context({'token': 'a', 'user_id': 'alice'})
+        self.clients.for_context({'token': 'b', 'user_id': 'bob'})
+        self.clients.for_context({'token': 'c', 'user_id': 'carol'})
+        self.assertIsNot(self.clients.for_context(
+            {'token': 'a', 'user_id': 'alice'}), first)
+
+
+class ScopedCacheTest(unittest.TestCase):
+    ''' Cached results are only served to callers who may read them. '''
+
+    @classmethod
+    def setUpClass(cls):
+        taxonomy = SyntheticTaxonomy(nodes=40, depth=3)
+        # the taxa only alice may read; the genomes are public
+        cls.private = FakeWorkspace(taxonomy,
+                                    readers={TAXON_WS: {ALICE['token']}})
+        cls.public = FakeWorkspace(taxonomy)
+        cls.servers = []
+        cls.urls = {}
+        for name in ('private', 'public'):
+            server, cls.urls[name] = serve(getattr(cls, name))
+            cls.servers.append(server)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+
+    def impl(self, name, **config):
+        getattr(self, name).reset()
+        config.update({'workspace-url': self.urls[name],
+                       'shock-url': 'http://localhost/shock'})
+        return TaxonAPI(config)
+
+    def test_private_object_only_served_to_its_reader(self):
+        impl = self.impl('private')
+        self.assertEqual(impl.get_scientific_name(ALICE, '1/5/1')[0],
+                         'Taxon 5')
+        self.assertEqual(impl.get_children(ALICE, '1/2/1')[0],
+                         ['1/5/1', '1/6/1', '1/7/1'])
+        self.assertEqual(len(impl.get_decorated_scientific_lineage(
+            ALICE, {'ref': '1/20/1'})[0]['decorated_scientific_lineage']), 2)
+        for ctx in (BOB, ANONYMOUS):
+            for method, param in ((impl.get_scientific_name, '1/5/1'),
+                                  (impl.get_children, '1/2/1'),
+                                  (impl.get_decorated_scientific_lineage,
+                                   {'ref': '1/20/1'})):
+                with self.assertRaises(ServerError):
+                    method(ctx, param)
+        # alice is still served from her cache
+        calls = self.private.stats()
+        impl.get_scientific_name(ALICE, '1/5/1')
+        impl.get_children(ALICE, '1/2/1')
+        self.assertEqual(self.private.stats(), calls)
+
+    def test_private_keys_are_scoped(self):
+        impl = self.impl('private')
+        alice = impl._access(ALICE)
+        anonymous = impl._access(ANONYMOUS)
+        self.assertTrue(impl._is_public(anonymous, '2'))
+        self.assertFalse(impl._is_public(anonymous, '1'))
+        self.assertFalse(impl._is_public(alice, 'ReferenceTaxons'))
+        self.assertIsNone(impl._object_scope(alice, '2/3/1'))
+        self.assertEqual(impl._object_scope(alice, '1/3/1'),
+                         ('user', 'alice'))
+        self.assertEqual(impl._object_scope(anonymous, '1/3/1'),
+                         ('anonymous',))
+        self.assertEqual(impl._object_key('1/3/1', False, None,
+                                          ('user', 'alice'))[-1],
+                         ('user', 'alice'))
+        self.assertNotEqual(impl._children_key(alice, '1/2/1'),
+                            impl._children_key(anonymous, '1/2/1'))
+
+    def test_private_objects_not_in_shared_store(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'objects.sqlite3')
+        impl = self.impl('private', **{'shared-cache-path': path})
+        impl.get_scientific_name(ALICE, '1/5/1')
+        impl.get_info(ALICE, '2/3/1')
+        with sqlite3.connect(path) as conn:
+            keys = [k for k, in conn.execute('SELECT key FROM objects')]
+        self.assertEqual(len(keys), 1)
+        self.assertIn('2/3/1', keys[0])
+
+    def test_trusted_snapshot_needs_no_workspace_call(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'taxa.jsonl')
+        write_snapshot(self.public, path)
+        impl = self.impl('public', **{'taxonomy-snapshot-path': path,
+                                      'taxonomy-snapshot-public': 'true'})
+        self.public.reset()
+        for ctx in (ALICE, ANONYMOUS):
+            self.assertEqual(impl.get_scientific_name(ctx, '1/5/1')[0],
+                             'Taxon 5')
+            self.assertEqual(impl.get_children(ctx, '1/2/1')[0],
+                             ['1/5/1', '1/6/1', '1/7/1'])
+        self.assertEqual(self.public.stats(), {})
+
+        # otherwise the workspace is asked whether it is public
+        impl = self.impl('public', **{'taxonomy-snapshot-path': path})
+        self.public.reset()
+        impl.get_scientific_name(ANONYMOUS, '1/5/1')
+        self.assertEqual(self.public.stats(), {'get_workspace_info': 1})
+
+    def test_public_objects_are_shared(self):
+        impl = self.impl('public')
+        for ctx in (ALICE, BOB, ANONYMOUS):
+            self.assertEqual(impl.get_scientific_name(ctx, '1/5/1')[0],
+                             'Taxon 5')
+            self.assertEqual(len(impl.get_decorated_scientific_lineage(
+                ctx, {'ref': '1/20/1'})[0]['decorated_scientific_lineage']),
+                2)
+            self.assertEqual(len(impl.get_children(ctx, '1/2/1')[0]), 3)
+            if ctx is ALICE:
+                calls = self.public.stats()
+        # bob and anonymous callers are served what alice fetched, apart
+        # from the children, which are listed per caller
+        after = self.public.stats()
+        self.assertEqual(after.pop('list_referencing_objects'), 3)
+        calls.pop('list_referencing_objects')
+        self.assertEqual(after, calls)
+        self.assertEqual(calls['get_workspace_info'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
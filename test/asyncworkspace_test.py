@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from TaxonAPI.asyncworkspace import AsyncWorkspace, run_sync
+
+
+class BlockingWorkspace(object):
+    ''' Answers each call only once `expected` calls are in flight. '''
+
+    url = 'http://localhost/ws'
+
+    def __init__(self, expected):
+        self.barrier = threading.Barrier(expected, timeout=5)
+
+    def ver(self):
+        self.barrier.wait()
+        return '0.8.0'
+
+    def get_object_info3(self, params):
+        self.barrier.wait()
+        return {'infos': [[1, params['objects'][0]['ref']]]}
+
+    def fail(self):
+        raise ValueError('no such object')
+
+
+class AsyncWorkspaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_calls_overlap(self):
+        aws = AsyncWorkspace(BlockingWorkspace(2), self.pool)
+
+        async def fetch():
+            return await asyncio.gather(
+                aws.ver(),
+                aws.get_object_info3({'objects': [{'ref': '1/2/3'}]}),
+                aws.run_blocking(lambda: aws.url))
+
+        # the calls would time out on the barrier if they ran one by one
+        ver, info, url = run_sync(fetch())
+        self.assertEqual(ver, '0.8.0')
+        self.assertEqual(info, {'infos': [[1, '1/2/3']]})
+        self.assertEqual(url, 'http://localhost/ws')
+
+    def test_errors_propagate(self):
+        aws = AsyncWorkspace(BlockingWorkspace(1), self.pool)
+        with self.assertRaises(ValueError):
+            run_sync(aws.fail())
+
+
+if __name__ == '__main__':
+    unittest.main()
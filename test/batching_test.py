@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+
+from TaxonAPI.batching import BatchDispatcher
+
+
+class BatchDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def fetch(self, specs, key):
+        self.calls.append((list(specs), key))
+        return [{'ref': spec['ref'], 'key': key} for spec in specs]
+
+    def submit_concurrently(self, dispatcher, specs):
+        results = {}
+
+        def caller(spec, key):
+            results[spec['ref']] = dispatcher.submit(spec, key)
+        threads = [threading.Thread(target=caller, args=s) for s in specs]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def blocking_fetch(self, release):
+        started = []
+
+        def fetch(specs, key):
+            started.append(specs)
+            if len(started) == 1:
+                release.wait(5)
+            return self.fetch(specs, key)
+        return fetch
+
+    def test_fetches_behind_one_in_flight_are_merged(self):
+        release = threading.Event()
+        dispatcher = BatchDispatcher(self.blocking_fetch(release), window=5,
+                                     max_batch=3)
+        first = threading.Thread(target=dispatcher.submit,
+                                 args=({'ref': '1/0/1'}, False))
+        first.start()
+        while not dispatcher.stats()['batches']:
+            time.sleep(0.001)
+        threading.Timer(0.2, release.set).start()
+        specs = [({'ref': '1/%d/1' % i}, False) for i in range(1, 6)]
+        results = self.submit_concurrently(dispatcher, specs)
+        first.join()
+        # one full batch is sent at once, the rest when the first returns
+        self.assertEqual(sorted(len(c[0]) for c in self.calls), [1, 2, 3])
+        self.assertEqual(len(self.calls[-1][0]), 2)
+        self.assertEqual(results['1/4/1'], {'ref': '1/4/1', 'key': False})
+        self.assertEqual(dispatcher.stats(), {'batches': 3, 'objects': 6})
+
+    def test_queued_fetch_waits_for_window_at_most(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        dispatcher = BatchDispatcher(self.blocking_fetch(release),
+                                     window=0.05)
+        threading.Thread(target=dispatcher.submit,
+                         args=({'ref': '1/0/1'},)).start()
+        while not dispatcher.stats()['batches']:
+            time.sleep(0.001)
+        self.assertEqual(dispatcher.submit({'ref': '1/1/1'}),
+                         {'ref': '1/1/1', 'key': None})
+        self.assertFalse(release.is_set())
+
+    def test_keys_are_not_mixed(self):
+        dispatcher = BatchDispatcher(self.fetch, window=0.05, max_batch=10)
+        specs = [({'ref': '1/1/1'}, False), ({'ref': '1/2/1'}, True)]
+        results = self.submit_concurrently(dispatcher, specs)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(results['1/2/1'], {'ref': '1/2/1', 'key': True})
+
+    def test_lone_fetch_is_sent_at_once(self):
+        dispatcher = BatchDispatcher(self.fetch, window=60)
+        start = time.monotonic()
+        self.assertEqual(dispatcher.submit({'ref': '1/1/1'}),
+                         {'ref': '1/1/1', 'key': None})
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.calls, [([{'ref': '1/1/1'}], None)])
+        # and the next, once that one has returned
+        dispatcher.submit({'ref': '1/2/1'})
+        self.assertEqual(len(self.calls), 2)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_errors_reach_every_caller(self):
+        def fail(specs, no_data):
+            raise ValueError('workspace unavailable')
+        dispatcher = BatchDispatcher(fail, window=60)
+        with self.assertRaises(ValueError):
+            dispatcher.submit({'ref': '1/1/1'})
+        # a failed fetch is no longer in flight
+        with self.assertRaises(ValueError):
+            dispatcher.submit({'ref': '1/2/1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
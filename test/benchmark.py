@@ -0,0 +1,284 @@
+'''
+Offline benchmark of the TaxonAPI methods.
+
+Starts a FakeWorkspace (see fakeworkspace.py) serving a synthetic taxonomy
+on a local port, points a TaxonAPI at it and calls each method with refs
+drawn at random from the taxonomy, reporting throughput, p50 and p99
+latency and the workspace calls each method call costs. With
+--target wsgi the calls go through TaxonAPIServer.application as JSON-RPC
+requests instead, which adds request parsing, dispatch and serialization.
+
+Runs with lib on the PYTHONPATH, e.g.
+
+    PYTHONPATH=lib python test/benchmark.py --nodes 2500000 --depth 12 \\
+        --latency-ms 5 --threads 8 --methods get_all_data,get_children
+
+Config options of the service can be set with --set, e.g.
+--set workspace-batch-window-ms=0 to measure without call merging. The
+same --seed gives the same refs in the same order.
+'''
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakeworkspace  # noqa: E402
+
+_SINGLE_REF = ['get_parent', 'get_children', 'get_genome_annotations',
+               'get_scientific_lineage', 'get_scientific_name',
+               'get_taxonomic_id', 'get_kingdom', 'get_domain',
+               'get_genetic_code', 'get_aliases', 'get_info', 'get_history',
+               'get_provenance', 'get_id', 'get_name', 'get_version']
+_BATCH = ['get_parent_batch', 'get_scientific_lineage_batch',
+          'get_scientific_name_batch', 'get_taxonomic_id_batch',
+          'get_kingdom_batch', 'get_domain_batch', 'get_genetic_code_batch',
+          'get_aliases_batch']
+
+
+class Workload(object):
+    '''
+    Draws the params of calls to each method from a synthetic taxonomy.
+    '''
+
+    def __init__(self, taxonomy, seed=1, batch_size=20):
+        self.taxonomy = taxonomy
+        self.batch_size = batch_size
+        self._rng = random.Random(seed)
+
+    def ref(self, i):
+        return '%d/%d/1' % (fakeworkspace.TAXON_WS, i)
+
+    def any_taxon(self):
+        return self.ref(self._rng.randint(1, self.taxonomy.nodes))
+
+    def internal_taxon(self):
+        return self.ref(self._rng.randint(1, self.taxonomy.last_internal()))
+
+    def methods(self):
+        return (_SINGLE_REF + _BATCH +
+                ['get_all_data', 'get_decorated_scientific_lineage',
+                 'get_decorated_children', 'get_subtree',
+                 'get_children_page', 'get_genome_annotations_page',
+                 'status'])
+
+    def params(self, method):
+        ''' The params list of one call of method. '''
+        if method in ('get_children', 'get_decorated_children'):
+            return [self.internal_taxon() if method == 'get_children'
+                    else {'ref': self.internal_taxon()}]
+        if method in _SINGLE_REF:
+            return [self.any_taxon()]
+        if method in _BATCH:
+            return [[self.any_taxon() for _ in range(self.batch_size)]]
+        if method == 'get_all_data':
+            return [{'ref': self.any_taxon(),
+                     'include_decorated_scientific_lineage': 1,
+                     'include_decorated_children': 1}]
+        if method == 'get_decorated_scientific_lineage':
+            return [{'ref': self.any_taxon()}]
+        if method == 'get_subtree':
+            return [{'ref': self.internal_taxon(), 'max_depth': 2,
+                     'fields': ['scientific_name'], 'limit': 1000}]
+        if method == 'get_children_page':
+            return [{'ref': self.internal_taxon(), 'limit': 100}]
+        if method == 'get_genome_annotations_page':
+            return [{'ref': self.any_taxon(), 'limit': 100}]
+        if method == 'status':
+            return []
+        raise ValueError('No workload for method ' + method)
+
+
+def service_config(workspace_url, overrides=()):
+    ''' The TaxonAPI config for a fake workspace at workspace_url. '''
+    config = {'workspace-url': workspace_url,
+              'shock-url': 'http://localhost/shock',
+              'auth-service-url': 'http://localhost/auth'}
+    for item in overrides:
+        key, _, value = item.partition('=')
+        config[key] = value
+    return config
+
+
+def impl_caller(config):
+    ''' Return call(method, params), calling a TaxonAPI directly. '''
+    from TaxonAPI.TaxonAPIImpl import TaxonAPI
+    impl = TaxonAPI(config)
+
+    def call(method, params):
+        getattr(impl, method)({}, *params)
+    return call
+
+
+def load_application(config):
+    '''
+    Import TaxonAPIServer with config and return its WSGI application.
+    The server reads its config when first imported, so this works once
+    per process.
+    '''
+    with tempfile.NamedTemporaryFile('w', suffix='.cfg',
+                                     delete=False) as cfg:
+        cfg.write('[TaxonAPI]\n')
+        for key, value in config.items():
+            cfg.write('%s = %s\n' % (key, value))
+    os.environ['KB_DEPLOYMENT_CONFIG'] = cfg.name
+    from TaxonAPI import TaxonAPIServer
+    return TaxonAPIServer.application
+
+
+def wsgi_request(application, body):
+    ''' POST body to a WSGI application; return (status, response body). '''
+    environ = {'REQUEST_METHOD': 'POST',
+               'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body),
+               'REMOTE_ADDR': '127.0.0.1',
+               'PATH_INFO': '/'}
+    status = []
+    response = b''.join(application(
+        environ, lambda s, headers: status.append(s)))
+    return status[0], response
+
+
+def wsgi_caller(config):
+    ''' Return call(method, params), calling through the WSGI application. '''
+    application = load_application(config)
+    ids = iter(range(1, sys.maxsize))
+
+    def call(method, params):
+        body = json.dumps({'version': '1.1', 'id': str(next(ids)),
+                           'method': 'TaxonAPI.' + method,
+                           'params': params}).encode('utf-8')
+        status, response = wsgi_request(application, body)
+        if not status.startswith('200'):
+            raise RuntimeError('%s: %s' % (status, response[:500]))
+    return call
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(q * len(sorted_values)))]
+
+
+def run(call, calls, threads):
+    '''
+    Make the calls, a list of (method, params), on threads threads.
+    Returns the latency of each call in seconds, the exceptions of failed
+    calls and the wall clock time taken.
+    '''
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(item):
+        method, params = item
+        start = time.perf_counter()
+        try:
+            call(method, params)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, calls))
+    return latencies, errors, time.perf_counter() - start
+
+
+def benchmark(call, workload, workspace, methods, calls, warmup, threads):
+    ''' Benchmark each of methods; yields a result dict per method. '''
+    for method in methods:
+        run(call, [(method, workload.params(method))
+                   for _ in range(warmup)], threads)
+        workspace.reset()
+        latencies, errors, wall = run(
+            call, [(method, workload.params(method)) for _ in range(calls)],
+            threads)
+        latencies.sort()
+        ws_calls = sum(workspace.stats().values())
+        yield {'method': method,
+               'calls': calls,
+               'errors': len(errors),
+               'first_error': str(errors[0])[:200] if errors else None,
+               'throughput': calls / wall if wall else 0.0,
+               'p50_ms': percentile(latencies, 0.50) * 1000,
+               'p99_ms': percentile(latencies, 0.99) * 1000,
+               'ws_calls_per_call': ws_calls / float(calls)}
+
+
+def print_header(target):
+    print('%-36s %8s %10s %9s %9s %9s %7s' % (
+        target, 'calls', 'calls/s', 'p50 ms', 'p99 ms', 'ws/call', 'errors'))
+
+
+def print_result(r):
+    print('%-36s %8d %10.1f %9.2f %9.2f %9.2f %7d' % (
+        r['method'], r['calls'], r['throughput'], r['p50_ms'],
+        r['p99_ms'], r['ws_calls_per_call'], r['errors']))
+    if r['first_error']:
+        print('    first error: ' + r['first_error'])
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark TaxonAPI against a synthetic local workspace.')
+    fakeworkspace.add_arguments(parser)
+    parser.add_argument('--target', choices=['impl', 'wsgi'], default='impl',
+                        help='call TaxonAPIImpl directly or through the '
+                             'WSGI application (default impl)')
+    parser.add_argument('--methods',
+                        help='comma separated methods (default all)')
+    parser.add_argument('--calls', type=int, default=200,
+                        help='measured calls per method (default 200)')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='unmeasured calls per method first (default 20)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='concurrent callers (default 1)')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='refs per call of the *_batch methods')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='set a service config option')
+    parser.add_argument('--json', metavar='FILE',
+                        help='also write the results to FILE as JSON')
+    args = parser.parse_args(argv)
+
+    workspace = fakeworkspace.from_arguments(args)
+    server, url = fakeworkspace.serve(workspace)
+    config = service_config(url, args.set)
+    workload = Workload(workspace.taxonomy, args.seed, args.batch_size)
+    methods = (args.methods.split(',') if args.methods
+               else workload.methods())
+    caller = impl_caller if args.target == 'impl' else wsgi_caller
+    call = caller(config)
+    print('%d taxa, fanout %d, %g ms per workspace call, %d thread(s)' % (
+        args.nodes, workspace.taxonomy.fanout, args.latency_ms,
+        args.threads))
+    print_header(args.target)
+    results = []
+    try:
+        for result in benchmark(call, workload, workspace, methods,
+                                args.calls, args.warmup, args.threads):
+            results.append(result)
+            print_result(result)
+    finally:
+        server.shutdown()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
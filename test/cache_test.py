@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from TaxonAPI.cache import ObjectCache, is_versioned_ref
+from TaxonAPI.sharedcache import SharedObjectStore
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ObjectCacheTest(unittest.TestCase):
+
+    def test_is_versioned_ref(self):
+        self.assertTrue(is_versioned_ref('1779/42/1'))
+        self.assertTrue(is_versioned_ref('ReferenceTaxons/1_taxon/1'))
+        self.assertTrue(is_versioned_ref('1/2/3;4/5/6'))
+        self.assertFalse(is_versioned_ref('ReferenceTaxons/45157_taxon'))
+        self.assertFalse(is_versioned_ref('1/2/3;4/5'))
+
+    def test_hit_and_miss(self):
+        cache = ObjectCache(max_bytes=1024)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', {'x': 1})
+        self.assertEqual(cache.get('a'), {'x': 1})
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = ObjectCache(max_bytes=30)
+        cache.put('a', 'x' * 10)
+        cache.put('b', 'y' * 10)
+        cache.get('a')
+        cache.put('c', 'z' * 10)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'x' * 10)
+        self.assertEqual(cache.get('c'), 'z' * 10)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], 30)
+
+    def test_oversized_values_are_not_cached(self):
+        cache = ObjectCache(max_bytes=8)
+        cache.put('a', 'x' * 100)
+        self.assertIsNone(cache.get('a'))
+
+    def test_ttl_policies(self):
+        clock = FakeClock()
+        cache = ObjectCache(max_bytes=1024, versioned_ttl=0,
+                            unversioned_ttl=10, clock=clock)
+        cache.put('versioned', 1, versioned=True)
+        cache.put('unversioned', 2, versioned=False)
+        clock.now = 9
+        self.assertEqual(cache.get('unversioned'), 2)
+        clock.now = 11
+        self.assertIsNone(cache.get('unversioned'))
+        self.assertEqual(cache.get('versioned'), 1)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class SharedObjectStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache', 'objects.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_versioned_entries_are_shared(self):
+        key = ('object', '1/2/3', False, None)
+        first = ObjectCache(max_bytes=1024, shared=SharedObjectStore(self.path))
+        first.put(key, {'data': {'scientific_name': 'root'}}, versioned=True)
+        first.put(('object', '1/2', False, None), {'data': {}}, versioned=False)
+
+        # a second worker process opening the same file
+        second = ObjectCache(max_bytes=1024, shared=SharedObjectStore(self.path))
+        self.assertEqual(second.get(key), {'data': {'scientific_name': 'root'}})
+        self.assertIsNone(second.get(('object', '1/2', False, None)))
+        stats = second.stats()
+        self.assertEqual(stats['shared']['hits'], 1)
+        # promoted into the in-process cache
+        self.assertEqual(stats['entries'], 1)
+
+    def test_unshared_entries_stay_in_process(self):
+        key = ('object', '1/2/3', False, None, ('user', 'alice'))
+        store = SharedObjectStore(self.path)
+        first = ObjectCache(max_bytes=1024, shared=store)
+        first.put(key, {'data': {}}, versioned=True, shared=False)
+        self.assertEqual(first.get(key, shared=False), {'data': {}})
+        self.assertIsNone(store.get(key))
+
+        # and are never read from the store, e.g. one written before
+        store.put(key, {'data': {}})
+        second = ObjectCache(max_bytes=1024, shared=store)
+        self.assertIsNone(second.get(key, shared=False))
@@ -0,0 +1,408 @@
+'''
+A stand-in for the Workspace service, serving a synthetic taxonomy.
+
+Used by benchmark.py and loadtest.py to measure the server without a KBase
+deployment. The taxonomy is a complete tree of Taxon objects with a fixed
+fanout, computed on demand, so even millions of taxa take no memory:
+object 1 is the root and the parent of object i is (i - 2) // fanout + 1.
+Taxa are in the ReferenceTaxons workspace (id 1); each taxon is referred
+to by a number of Genome objects in ReferenceGenomes (id 2). Both are
+public unless given readers, the tokens that may read them.
+
+The stand-in answers the Workspace methods that TaxonAPI calls, over
+JSON-RPC on a local HTTP server, with a configurable delay per call and
+per object fetched, and reports the calls it has answered at GET /stats.
+It can also be run on its own, e.g.
+
+    python test/fakeworkspace.py --nodes 2500000 --depth 12 --port 5001
+'''
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TAXON_WS = 1
+GENOME_WS = 2
+TAXON_TYPE = 'KBaseGenomeAnnotations.Taxon-1.0'
+GENOME_TYPE = 'KBaseGenomes.Genome-8.2'
+_WORKSPACES = {TAXON_WS: 'ReferenceTaxons', GENOME_WS: 'ReferenceGenomes'}
+_WS_IDS = {name: wsid for wsid, name in _WORKSPACES.items()}
+
+
+class WorkspaceError(Exception):
+    pass
+
+
+class SyntheticTaxonomy(object):
+    '''
+    A complete tree of nodes taxa, at most depth levels below the root,
+    with genomes Genome objects referring to each taxon.
+    '''
+
+    def __init__(self, nodes=10000, depth=8, genomes=1):
+        if nodes < 1 or depth < 1:
+            raise ValueError('nodes and depth must be at least 1')
+        self.nodes = nodes
+        self.genomes = genomes
+        self.fanout = 2
+        while sum(self.fanout ** d for d in range(depth + 1)) < nodes:
+            self.fanout += 1
+
+    def parent(self, i):
+        return None if i == 1 else (i - 2) // self.fanout + 1
+
+    def children(self, i):
+        first = (i - 1) * self.fanout + 2
+        return range(first, min(first + self.fanout, self.nodes + 1))
+
+    def is_leaf(self, i):
+        return (i - 1) * self.fanout + 2 > self.nodes
+
+    def last_internal(self):
+        ''' The highest numbered taxon that has children. '''
+        return (self.nodes - 2) // self.fanout + 1 if self.nodes > 1 else 1
+
+    def lineage(self, i):
+        ''' The taxa from the root down to i. '''
+        path = []
+        while i is not None:
+            path.append(i)
+            i = self.parent(i)
+        return path[::-1]
+
+    def name(self, i):
+        return 'root' if i == 1 else 'Taxon %d' % i
+
+    def data(self, i):
+        parent = self.parent(i)
+        lineage = self.lineage(i)
+        data = {'taxonomy_id': i,
+                'scientific_name': self.name(i),
+                'scientific_lineage': '; '.join(
+                    self.name(t) for t in lineage[1:-1]),
+                'rank': 'species' if self.is_leaf(i) else 'no rank',
+                'kingdom': self.name(lineage[min(1, len(lineage) - 1)]),
+                'domain': 'Bacteria',
+                'aliases': ['alias %d' % i],
+                'genetic_code': 11}
+        if parent is not None:
+            data['parent_taxon_ref'] = '%d/%d/1' % (TAXON_WS, parent)
+        return data
+
+    def genome_ids(self, i):
+        first = (i - 1) * self.genomes + 1
+        return range(first, first + self.genomes)
+
+    def genome_taxon(self, g):
+        return (g - 1) // self.genomes + 1
+
+    def genome_data(self, g):
+        return {'id': 'genome_%d' % g, 'scientific_name': self.name(
+            self.genome_taxon(g)), 'taxon_ref': '%d/%d/1' % (
+                TAXON_WS, self.genome_taxon(g))}
+
+
+class FakeWorkspace(object):
+    '''
+    Implements the Workspace methods TaxonAPI uses, on a SyntheticTaxonomy.
+
+    latency - seconds added to every call.
+    latency_per_object - seconds added per object returned by get_objects2.
+    readers - maps a workspace id to the tokens that may read it; the
+        workspaces not in it are public.
+    '''
+
+    def __init__(self, taxonomy, latency=0, latency_per_object=0,
+                 readers=None):
+        self.taxonomy = taxonomy
+        self.latency = latency
+        self.latency_per_object = latency_per_object
+        self.readers = readers or {}
+        self._lock = threading.Lock()
+        self._caller = threading.local()
+        self.calls = Counter()
+
+    def call(self, method, params, token=None):
+        '''
+        Run a Workspace method as the caller with token, e.g.
+        call('get_objects2', [{...}]).
+        '''
+        name = method.split('.')[-1]
+        if name.startswith('_') or name in ('call', 'stats', 'reset'):
+            raise WorkspaceError('No such method: ' + method)
+        func = getattr(self, name, None)
+        if func is None:
+            raise WorkspaceError('No such method: ' + method)
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self._caller.token = token
+        return func(*params)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    # object refs
+
+    def _readable(self, wsid):
+        readers = self.readers.get(wsid)
+        return readers is None or self._caller.token in readers
+
+    def _resolve(self, ref, check_access=True):
+        '''
+        Return (workspace id, object id) of ref. Objects reached through a
+        reference path need not be readable themselves.
+        '''
+        parts = ref.split('/')
+        if len(parts) not in (2, 3):
+            raise WorkspaceError('Illegal number of separators / in ' +
+                                 'object reference ' + ref)
+        ws, obj = parts[0], parts[1]
+        wsid = int(ws) if ws.isdigit() else _WS_IDS.get(ws)
+        if wsid not in _WORKSPACES:
+            raise WorkspaceError('No workspace with name ' + ws + ' exists')
+        if check_access and not self._readable(wsid):
+            raise WorkspaceError('Object %s cannot be accessed: may not read '
+                                 'workspace %d' % (ref, wsid))
+        if obj.isdigit():
+            objid = int(obj)
+        elif wsid == TAXON_WS and obj.endswith('_taxon'):
+            objid = int(obj[:-len('_taxon')])
+        elif wsid == GENOME_WS and obj.startswith('genome_'):
+            objid = int(obj[len('genome_'):])
+        else:
+            objid = 0
+        count = (self.taxonomy.nodes if wsid == TAXON_WS
+                 else self.taxonomy.nodes * self.taxonomy.genomes)
+        if not 1 <= objid <= count or (len(parts) == 3 and parts[2] != '1'):
+            raise WorkspaceError('No object with id %s exists in workspace %d'
+                                 % (ref, wsid))
+        return wsid, objid
+
+    def _info(self, wsid, objid):
+        if wsid == TAXON_WS:
+            name, type_ = '%d_taxon' % objid, TAXON_TYPE
+        else:
+            name, type_ = 'genome_%d' % objid, GENOME_TYPE
+        return [objid, name, type_, '2017-06-01T00:00:00+0000', 1,
+                'kbasedata', wsid, _WORKSPACES[wsid],
+                hashlib.md5(name.encode('utf-8')).hexdigest(), 500, {}]
+
+    def _references(self, wsid, objid):
+        ''' The objects that the object refers to. '''
+        if wsid == GENOME_WS:
+            return [(TAXON_WS, self.taxonomy.genome_taxon(objid))]
+        parent = self.taxonomy.parent(objid)
+        return [] if parent is None else [(TAXON_WS, parent)]
+
+    def _referrers(self, wsid, objid):
+        ''' The objects that refer to the object and the caller may read. '''
+        if wsid == GENOME_WS:
+            return []
+        return [r for r in
+                [(TAXON_WS, c) for c in self.taxonomy.children(objid)] +
+                [(GENOME_WS, g) for g in self.taxonomy.genome_ids(objid)]
+                if self._readable(r[0])]
+
+    def _data(self, wsid, objid):
+        if wsid == TAXON_WS:
+            return self.taxonomy.data(objid)
+        return self.taxonomy.genome_data(objid)
+
+    # Workspace methods
+
+    def get_objects2(self, params):
+        results = []
+        for spec in params['objects']:
+            try:
+                target = self._resolve(spec['ref'])
+                path = [target]
+                for ref in spec.get('obj_ref_path') or []:
+                    step = self._resolve(ref, check_access=False)
+                    if step not in self._references(*target):
+                        raise WorkspaceError(
+                            'Reference path from %s to %s is not valid' %
+                            (spec['ref'], ref))
+                    target = step
+                    path.append(step)
+            except WorkspaceError:
+                if params.get('ignoreErrors'):
+                    results.append(None)
+                    continue
+                raise
+            res = {'info': self._info(*target),
+                   'path': ['%d/%d/1' % step for step in path],
+                   'refs': ['%d/%d/1' % r for r in self._references(*target)],
+                   'provenance': [], 'created': '2017-06-01T00:00:00+0000',
+                   'creator': 'kbasedata', 'orig_wsid': target[0],
+                   'copy_source_inaccessible': 0, 'extracted_ids': {}}
+            if not params.get('no_data'):
+                data = self._data(*target)
+                if spec.get('included'):
+                    fields = [f.lstrip('/') for f in spec['included']]
+                    data = {f: data[f] for f in fields if f in data}
+                res['data'] = data
+            results.append(res)
+        if self.latency_per_object:
+            time.sleep(self.latency_per_object * len(results))
+        return {'data': results}
+
+    def list_referencing_objects(self, object_ids):
+        return [[self._info(*r)
+                 for r in self._referrers(*self._resolve(o['ref']))]
+                for o in object_ids]
+
+    def list_referencing_object_counts(self, object_ids):
+        return [len(self._referrers(*self._resolve(o['ref'])))
+                for o in object_ids]
+
+    def translate_to_MD5_types(self, types):
+        return {t: t.split('-')[0] + '-' +
+                hashlib.md5(t.encode('utf-8')).hexdigest() for t in types}
+
+    def get_type_info(self, type_):
+        version = {TAXON_TYPE.split('-')[0]: TAXON_TYPE,
+                   GENOME_TYPE.split('-')[0]: GENOME_TYPE}.get(
+                       type_, type_ + '-1.0')
+        return {'type_def': version, 'type_vers': [version],
+                'released_type_vers': [version]}
+
+    def get_workspace_info(self, wsi):
+        wsid = wsi.get('id') or _WS_IDS.get(wsi.get('workspace'))
+        if wsid not in _WORKSPACES:
+            raise WorkspaceError('No workspace with name %s exists' % wsi)
+        if not self._readable(wsid):
+            raise WorkspaceError('May not read workspace %d' % wsid)
+        public = wsid not in self.readers
+        return [wsid, _WORKSPACES[wsid], 'kbasedata',
+                '2017-06-01T00:00:00+0000', self.taxonomy.nodes,
+                'n' if public else 'r', 'r' if public else 'n',
+                'unlocked', {}]
+
+    def get_object_history(self, object_identity):
+        return [self._info(*self._resolve(object_identity['ref']))]
+
+    def get_object_provenance(self, object_ids):
+        return [{'info': self._info(*self._resolve(o['ref'])),
+                 'provenance': [{'time': '2017-06-01T00:00:00+0000',
+                                 'service': 'taxonomy_loader',
+                                 'method': 'load_taxa',
+                                 'input_ws_objects': [],
+                                 'description': 'Synthetic taxonomy'}]}
+                for o in object_ids]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length))
+        try:
+            result = self.server.workspace.call(
+                request['method'], request.get('params') or [],
+                token=self.headers.get('Authorization'))
+            status, body = 200, {'version': '1.1', 'id': request.get('id'),
+                                 'result': [result]}
+        except WorkspaceError as e:
+            status, body = 500, {'version': '1.1', 'id': request.get('id'),
+                                 'error': {'name': 'JSONRPCError',
+                                           'code': -32500,
+                                           'message': str(e)}}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # GET /stats returns the number of calls of each method so far
+        if self.path.rstrip('/') != '/stats':
+            self.send_error(404)
+            return
+        data = json.dumps(self.server.workspace.stats()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_snapshot(workspace, path, taxa=None, versions=None):
+    '''
+    Write taxa (default all) of workspace to path as a taxonomy snapshot,
+    in the JSON lines form export_taxonomy_snapshot.py writes. versions
+    maps a taxon to the version to record for it instead of 1.
+    '''
+    if taxa is None:
+        taxa = range(1, workspace.taxonomy.nodes + 1)
+    with open(path, 'w') as f:
+        for i in taxa:
+            info = workspace._info(TAXON_WS, i)
+            info[4] = (versions or {}).get(i, info[4])
+            f.write(json.dumps({'info': info,
+                                'data': workspace.taxonomy.data(i)}) + '\n')
+
+
+def serve(workspace, host='127.0.0.1', port=0):
+    '''
+    Serve workspace on a background thread. Returns the HTTP server, to be
+    shut down with shutdown(), and its URL.
+    '''
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.workspace = workspace
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://%s:%d' % (host, server.server_port)
+
+
+def add_arguments(parser):
+    ''' Add the options that describe a synthetic workspace to parser. '''
+    parser.add_argument('--nodes', type=int, default=10000,
+                        help='number of taxa (default 10000)')
+    parser.add_argument('--depth', type=int, default=8,
+                        help='levels below the root (default 8)')
+    parser.add_argument('--genomes', type=int, default=1,
+                        help='genomes referring to each taxon (default 1)')
+    parser.add_argument('--latency-ms', type=float, default=2,
+                        help='delay added to each workspace call (default 2)')
+    parser.add_argument('--object-latency-ms', type=float, default=0,
+                        help='delay added per object fetched (default 0)')
+
+
+def from_arguments(args):
+    return FakeWorkspace(
+        SyntheticTaxonomy(args.nodes, args.depth, args.genomes),
+        latency=args.latency_ms / 1000.0,
+        latency_per_object=args.object_latency_ms / 1000.0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve a synthetic taxonomy as a Workspace service.')
+    add_arguments(parser)
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    workspace = from_arguments(args)
+    server, url = serve(workspace, host='0.0.0.0', port=args.port)
+    print('Serving %d taxa (fanout %d) at %s' % (
+        args.nodes, workspace.taxonomy.fanout, url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
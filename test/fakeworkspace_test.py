@@ -0,0 +1,242 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fakeworkspace import FakeWorkspace, SyntheticTaxonomy, serve, \
+    write_snapshot
+from TaxonAPI.TaxonAPIImpl import TaxonAPI
+
+
+class SyntheticTaxonomyTest(unittest.TestCase):
+
+    def test_tree(self):
+        taxonomy = SyntheticTaxonomy(nodes=40, depth=3)
+        self.assertEqual(taxonomy.fanout, 3)
+        self.assertEqual(list(taxonomy.children(1)), [2, 3, 4])
+        self.assertEqual(list(taxonomy.children(13)), [38, 39, 40])
+        self.assertEqual(list(taxonomy.children(14)), [])
+        self.assertEqual(taxonomy.last_internal(), 13)
+        self.assertEqual(taxonomy.lineage(40), [1, 4, 13, 40])
+        for i in range(2, 41):
+            self.assertIn(i, taxonomy.children(taxonomy.parent(i)))
+
+    def test_large_tree_is_implicit(self):
+        taxonomy = SyntheticTaxonomy(nodes=2500000, depth=12)
+        self.assertEqual(len(taxonomy.lineage(2500000)), 12)
+        self.assertEqual(taxonomy.data(2500000)['scientific_name'],
+                         'Taxon 2500000')
+
+
+class FakeWorkspaceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workspace = FakeWorkspace(SyntheticTaxonomy(nodes=200, depth=4,
+                                                        genomes=2))
+        cls.server, url = serve(cls.workspace)
+        cls.impl = TaxonAPI({'workspace-url': url,
+                             'shock-url': 'http://localhost/shock'})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_children(self):
+        self.assertEqual(self.impl.get_children({}, '1/2/1')[0],
+                         ['1/%d/1' % i for i in
+                          self.workspace.taxonomy.children(2)])
+        self.assertEqual(self.impl.get_genome_annotations({}, '1/2/1')[0],
+                         ['2/3/1', '2/4/1'])
+
+    def test_lineage(self):
+        ret = self.impl.get_decorated_scientific_lineage(
+            {}, {'ref': '1/150/1'})[0]['decorated_scientific_lineage']
+        # below the root, down to the parent
+        self.assertEqual([t['ref'] for t in ret], ['1/%d/1' % i for i in
+                         self.workspace.taxonomy.lineage(150)[1:-1]])
+        self.assertEqual(self.impl.get_scientific_name(
+            {}, 'ReferenceTaxons/150_taxon')[0], 'Taxon 150')
+
+    def test_unusable_shared_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        not_a_dir = os.path.join(tmpdir, 'file')
+        open(not_a_dir, 'w').close()
+        # a directory in the way of the file, and a file in the way of its
+        # directory, fail like a read-only volume would
+        for path in (tmpdir, os.path.join(not_a_dir, 'cache.sqlite3')):
+            impl = TaxonAPI({'workspace-url': self.impl.workspaceURL,
+                             'shock-url': 'http://localhost/shock',
+                             'shared-cache-path': path})
+            self.assertNotIn('shared', impl.cache.stats())
+            self.assertEqual(impl.get_scientific_name({}, '1/5/1')[0],
+                             'Taxon 5')
+
+    def test_missing_object(self):
+        with self.assertRaises(Exception):
+            self.impl.get_parent({}, '1/201/1')
+
+    def subtree(self, params):
+        taxa, cursors = [], []
+        while True:
+            ret = self.impl.get_subtree({}, params)[0]
+            taxa.extend(ret['taxa'])
+            if not ret['truncated']:
+                self.assertEqual(ret['next_cursor'], '')
+                return taxa, cursors
+            cursors.append(ret['next_cursor'])
+            params = dict(params, cursor=ret['next_cursor'])
+
+    def test_subtree_pages(self):
+        taxonomy = self.workspace.taxonomy
+        # breadth first, children in ref order
+        expected, level = [], [1]
+        while level:
+            level = [(c, p) for p in level for c in taxonomy.children(p)]
+            expected.extend(level)
+            level = [c for c, _ in level]
+        full = self.impl.get_subtree({}, {'ref': '1/1/1',
+                                          'fields': ['scientific_name']})[0]
+        self.assertEqual(full['truncated'], 0)
+        self.assertEqual([(t['ref'], t['parent']) for t in full['taxa']],
+                         [('1/%d/1' % c, '1/%d/1' % p) for c, p in expected])
+        self.assertEqual(full['taxa'][0]['data'],
+                         {'scientific_name': 'Taxon %d' % expected[0][0]})
+        taxa, cursors = self.subtree({'ref': '1/1/1', 'limit': 7,
+                                      'fields': ['scientific_name']})
+        self.assertEqual(taxa, full['taxa'])
+        self.assertEqual(len(cursors), (len(expected) - 1) // 7)
+        # the stream picks up where a page left off
+        access = self.impl._access({})
+        self.assertEqual(list(self.impl.iter_subtree(
+            access, '1/1/1', fields=['scientific_name'], cursor=cursors[3])),
+            full['taxa'][28:])
+        self.assertEqual(list(self.impl.iter_subtree(
+            access, '1/1/1', fields=['scientific_name'])), full['taxa'])
+
+    def test_subtree_pages_below_max_depth(self):
+        shallow = self.impl.get_subtree({}, {'ref': '1/2/1',
+                                             'max_depth': 2})[0]['taxa']
+        self.assertEqual(set(t['depth'] for t in shallow), {1, 2})
+        for limit in (1, 2, 5):
+            taxa, _ = self.subtree({'ref': '1/2/1', 'max_depth': 2,
+                                    'limit': limit})
+            self.assertEqual(taxa, shallow)
+
+    def test_limit_must_be_positive(self):
+        for method in (self.impl.get_subtree, self.impl.get_children_page):
+            with self.assertRaises(ValueError):
+                method({}, {'ref': '1/1/1', 'limit': 0})
+        with self.assertRaises(ValueError):
+            self.impl.get_subtree({}, {'ref': '1/1/1', 'cursor': 'bad'})
+
+
+class LineageRoundTripTest(unittest.TestCase):
+    ''' Workspace calls made to walk up from a deep taxon. '''
+
+    @classmethod
+    def setUpClass(cls):
+        # a binary tree; taxon 1023 is nine levels below the root
+        cls.workspace = FakeWorkspace(SyntheticTaxonomy(nodes=1023, depth=9))
+        cls.server, cls.url = serve(cls.workspace)
+        cls.ancestors = cls.workspace.taxonomy.lineage(1023)[:-1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def walk(self, names):
+        '''
+        Return the decorated lineage of taxon 1023 and the get_objects2
+        calls made for it, with names (taxon id -> ref) known beforehand,
+        as get_decorated_children would leave them.
+        '''
+        impl = TaxonAPI({'workspace-url': self.url,
+                         'shock-url': 'http://localhost/shock'})
+        for i, ref in names.items():
+            impl.lineage_index.add_name(ref, self.workspace.taxonomy.name(i))
+        self.workspace.reset()
+        ret = impl.get_decorated_scientific_lineage(
+            {}, {'ref': '1/1023/1'})[0]['decorated_scientific_lineage']
+        self.assertEqual([t['ref'] for t in ret],
+                         ['1/%d/1' % i for i in self.ancestors[1:]])
+        return self.workspace.stats().get('get_objects2')
+
+    def test_correct_predictions(self):
+        # the taxon, then every named ancestor in one call, then the root,
+        # which scientific_lineage leaves out
+        self.assertEqual(self.walk({i: '1/%d/1' % i
+                                    for i in self.ancestors[1:]}), 3)
+
+    def test_wrong_prediction(self):
+        names = {i: '1/%d/1' % i for i in self.ancestors[1:]}
+        # the sibling of taxon 63, which the path check rejects; the walk
+        # then goes on from 63 with the remaining predictions
+        names[63] = '1/62/1'
+        self.assertEqual(self.walk(names), 4)
+
+    def test_no_predictions(self):
+        # one call per hop
+        self.assertEqual(self.walk({}), 1 + len(self.ancestors))
+
+
+class SnapshotChildrenTest(unittest.TestCase):
+    ''' Child taxa of the taxa in a snapshot that is older than the workspace. '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workspace = FakeWorkspace(SyntheticTaxonomy(nodes=40, depth=3))
+        cls.server, cls.url = serve(cls.workspace)
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmpdir, 'taxa.jsonl')
+        # built before taxa 7 and 40 were saved, and when taxon 3 was at
+        # version 0
+        write_snapshot(cls.workspace, cls.path,
+                       [i for i in range(1, 41) if i not in (7, 40)],
+                       versions={3: 0})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        shutil.rmtree(cls.tmpdir)
+
+    def impl(self, **config):
+        config.update({'workspace-url': self.url,
+                       'shock-url': 'http://localhost/shock',
+                       'taxonomy-snapshot-path': self.path,
+                       'taxonomy-snapshot-public': 'true'})
+        impl = TaxonAPI(config)
+        self.workspace.reset()
+        return impl
+
+    def test_children_saved_later_are_not_listed(self):
+        impl = self.impl()
+        self.assertEqual(impl.get_children({}, '1/2/1')[0],
+                         ['1/5/1', '1/6/1'])
+        self.assertEqual(impl.get_children({}, '1/13/1')[0],
+                         ['1/38/1', '1/39/1'])
+        self.assertEqual(self.workspace.stats(), {})
+
+    def test_children_from_the_workspace(self):
+        impl = self.impl(**{'taxonomy-snapshot-children': 'false'})
+        self.assertEqual(impl.get_children({}, '1/2/1')[0],
+                         ['1/5/1', '1/6/1', '1/7/1'])
+        self.assertEqual(impl.get_children({}, '1/13/1')[0],
+                         ['1/38/1', '1/39/1', '1/40/1'])
+        # the taxa themselves are still read from the snapshot
+        self.assertEqual(impl.get_scientific_name({}, '1/5/1')[0],
+                         'Taxon 5')
+        self.assertEqual(self.workspace.stats(),
+                         {'list_referencing_objects': 2})
+
+    def test_newer_version_is_listed_by_the_workspace(self):
+        impl = self.impl()
+        self.assertEqual(impl.get_children({}, '1/3/1')[0],
+                         ['1/8/1', '1/9/1', '1/10/1'])
+        self.assertEqual(self.workspace.stats(),
+                         {'list_referencing_objects': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
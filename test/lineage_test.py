@@ -0,0 +1,67 @@
+import unittest
+
+from TaxonAPI.lineage import LineageIndex
+
+
+class LineageIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = LineageIndex()
+        self.index.add('1/1/1', 'root', None)
+        self.index.add('1/2/1', 'cellular organisms', '1/1/1')
+        self.index.add('1/3/1', 'Eukaryota', '1/2/1')
+
+    def test_lineage(self):
+        self.assertEqual(self.index.lineage('1/3/1'),
+                         [('1/3/1', 'Eukaryota'),
+                          ('1/2/1', 'cellular organisms'),
+                          ('1/1/1', 'root')])
+        self.assertEqual(self.index.lineage('1/1/1'), [('1/1/1', 'root')])
+
+    def test_incomplete_lineage(self):
+        self.index.add('1/5/1', 'Rhodophyta', '1/4/1')
+        self.assertIsNone(self.index.lineage('1/5/1'))
+        self.assertIsNone(self.index.lineage('1/9/1'))
+        self.index.add('1/4/1', 'Bangiophyceae', '1/3/1')
+        self.assertEqual(len(self.index.lineage('1/5/1')), 5)
+
+    def test_sibling_reuses_ancestors(self):
+        self.index.lineage('1/3/1')
+        self.index.add('1/6/1', 'Viridiplantae', '1/3/1')
+        self.assertEqual(self.index.lineage('1/6/1')[1:],
+                         self.index.lineage('1/3/1'))
+
+    def test_unversioned_refs_are_ignored(self):
+        self.index.add('ReferenceTaxons/7_taxon', 'x', '1/3/1')
+        self.index.add('1/7/1', 'x', 'ReferenceTaxons/3_taxon')
+        self.assertIsNone(self.index.lineage('ReferenceTaxons/7_taxon'))
+        self.assertIsNone(self.index.lineage('1/7/1'))
+
+    def test_ref_named(self):
+        self.assertEqual(self.index.ref_named('Eukaryota'), '1/3/1')
+        self.index.add_name('1/8/1', 'Rhodophyta')
+        self.assertEqual(self.index.ref_named('Rhodophyta'), '1/8/1')
+        self.assertNotIn('1/8/1', self.index)
+        self.assertIn('1/3/1', self.index)
+        self.index.add_name('ReferenceTaxons/9_taxon', 'Fungi')
+        self.assertIsNone(self.index.ref_named('Fungi'))
+
+    def test_ambiguous_names_are_not_predicted(self):
+        self.index.add_name('1/8/1', 'Bacillus')
+        self.index.add_name('1/8/1', 'Bacillus')
+        self.assertEqual(self.index.ref_named('Bacillus'), '1/8/1')
+        self.index.add_name('1/9/1', 'Bacillus')
+        self.assertIsNone(self.index.ref_named('Bacillus'))
+
+    def test_full_index_ignores_new_taxa(self):
+        index = LineageIndex(max_nodes=2)
+        index.add('1/1/1', 'root', None)
+        index.add('1/2/1', 'cellular organisms', '1/1/1')
+        index.add('1/3/1', 'Eukaryota', '1/2/1')
+        self.assertNotIn('1/3/1', index)
+        self.assertEqual(len(index.lineage('1/2/1')), 2)
+
+    def test_node(self):
+        self.assertEqual(self.index.node('1/3/1'), ('Eukaryota', '1/2/1'))
+        self.assertEqual(self.index.node('1/1/1'), ('root', None))
+        self.assertIsNone(self.index.node('1/9/1'))
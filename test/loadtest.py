@@ -0,0 +1,357 @@
+'''
+Load test of the TaxonAPI WSGI application under uwsgi-like concurrency.
+
+Loads TaxonAPIServer.application once and forks --processes worker
+processes that each serve requests on --threads threads, as
+uwsgi --master --processes 5 --threads 5 does. Each thread calls the
+application directly: uwsgi parses HTTP in C, so leaving HTTP out keeps the
+measurement on the service itself. The workspace is a FakeWorkspace (see
+fakeworkspace.py) in a process of its own, or any workspace given with
+--workspace-url.
+
+The requests replayed are read from a file of JSON-RPC requests, one per
+line (a line may also hold a batch), or drawn from a weighted mix of
+methods over the synthetic taxonomy. --record saves the drawn requests for
+a later run. With --remap-refs the object refs of recorded production
+requests are mapped onto the synthetic taxonomy; a ref that repeats maps to
+the same taxon each time, so cache behaviour is preserved.
+
+By default every thread sends its next request as soon as the previous one
+is answered, which finds the saturation throughput. With --rate requests
+arrive at random at that average rate instead, queueing for a free thread,
+and latency includes the time spent queued, as in uwsgi's listen queue.
+
+Runs with lib on the PYTHONPATH, e.g.
+
+    PYTHONPATH=lib python test/loadtest.py --processes 5 --threads 5 \\
+        --nodes 2500000 --depth 12 --latency-ms 5 --duration 30
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark  # noqa: E402
+import fakeworkspace  # noqa: E402
+
+DEFAULT_MIX = ('get_all_data=4,get_decorated_children=2,'
+               'get_decorated_scientific_lineage=2,get_scientific_name=4,'
+               'get_parent=2,get_children=2,get_scientific_name_batch=1,'
+               'get_genome_annotations=1')
+
+_REF = re.compile(r'^[^/\s]+/[^/\s]+(/\d+)?$')
+
+# the application, loaded before the workers are forked
+_application = None
+
+
+def parse_mix(mix):
+    ''' Parse "method=weight,..." into a list of (method, weight). '''
+    weights = []
+    for item in mix.split(','):
+        method, _, weight = item.partition('=')
+        weights.append((method.strip(), float(weight or 1)))
+    return weights
+
+
+def generate(workload, weights, count, seed):
+    ''' Draw count JSON-RPC requests from the weighted methods. '''
+    rng = random.Random(seed)
+    methods = [m for m, _ in weights]
+    requests = []
+    for i in range(count):
+        method = rng.choices(methods, weights=[w for _, w in weights])[0]
+        requests.append({'version': '1.1', 'id': str(i),
+                         'method': 'TaxonAPI.' + method,
+                         'params': workload.params(method)})
+    return requests
+
+
+def remap_refs(value, taxonomy):
+    ''' Replace each object ref in value with a ref of the taxonomy. '''
+    if isinstance(value, dict):
+        return {k: remap_refs(v, taxonomy) for k, v in value.items()}
+    if isinstance(value, list):
+        return [remap_refs(v, taxonomy) for v in value]
+    if isinstance(value, str) and _REF.match(value):
+        taxon = zlib.crc32(value.encode('utf-8')) % taxonomy.nodes + 1
+        return '%d/%d/1' % (fakeworkspace.TAXON_WS, taxon)
+    return value
+
+
+def load_requests(path, taxonomy=None):
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                if taxonomy is not None:
+                    request = remap_refs(request, taxonomy)
+                requests.append(request)
+    return requests
+
+
+def label(request):
+    if isinstance(request, list):
+        return 'batch'
+    return request.get('method', 'unknown')
+
+
+def _serve_workspace(args, conn):
+    workspace = fakeworkspace.from_arguments(args)
+    _, url = fakeworkspace.serve(workspace)
+    conn.send(url)
+    threading.Event().wait()
+
+
+def _call(body):
+    ''' Returns True if the request succeeded. '''
+    status, response = benchmark.wsgi_request(_application, body)
+    if not status.startswith('200'):
+        return False
+    result = json.loads(response)
+    if isinstance(result, list):
+        return all('error' not in r for r in result)
+    return 'error' not in result
+
+
+def _worker(index, bodies, labels, args, start, conn):
+    '''
+    Serve requests on args.threads threads until start + warmup + duration.
+    Sends back a list of (label, latency, ok) of the requests that finished
+    after the warmup, and the service's cache statistics.
+    '''
+    from TaxonAPI import TaxonAPIServer
+    measure_from = start + args.warmup
+    stop = measure_from + args.duration
+    results = []
+    lock = threading.Lock()
+    stride = args.processes * args.threads
+
+    def record(i, arrived):
+        ok = _call(bodies[i])
+        done = time.monotonic()
+        if done >= measure_from and arrived < stop:
+            with lock:
+                results.append((labels[i], done - arrived, ok))
+
+    def closed_loop(k):
+        # each thread replays every stride-th request, in turn
+        i = index * args.threads + k
+        while time.monotonic() < stop:
+            record(i % len(bodies), time.monotonic())
+            i += stride
+
+    arrivals = queue.Queue()
+
+    def open_loop(k):
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            record(*item)
+
+    def schedule():
+        rng = random.Random(args.seed + index)
+        rate = args.rate / float(args.processes)
+        i = index
+        arrival = time.monotonic()
+        while arrival < stop:
+            arrival += rng.expovariate(rate)
+            delay = arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((i % len(bodies), arrival))
+            i += args.processes
+        for _ in range(args.threads):
+            arrivals.put(None)
+
+    while time.monotonic() < start:
+        time.sleep(0.001)
+    target = open_loop if args.rate else closed_loop
+    threads = [threading.Thread(target=target, args=(k,))
+               for k in range(args.threads)]
+    if args.rate:
+        threads.append(threading.Thread(target=schedule))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    conn.send((results, TaxonAPIServer.impl_TaxonAPI.stats()))
+    conn.close()
+
+
+def workspace_stats(url):
+    with urlopen(url + '/stats') as response:
+        return json.loads(response.read())
+
+
+def summarize(results, wall):
+    latencies = sorted(latency for _, latency, _ in results)
+    by_label = {}
+    for name, latency, ok in results:
+        by_label.setdefault(name, []).append((latency, ok))
+
+    def describe(entries):
+        values = sorted(latency for latency, _ in entries)
+        return {'requests': len(entries),
+                'errors': sum(1 for _, ok in entries if not ok),
+                'p50_ms': benchmark.percentile(values, 0.50) * 1000,
+                'p90_ms': benchmark.percentile(values, 0.90) * 1000,
+                'p99_ms': benchmark.percentile(values, 0.99) * 1000,
+                'p999_ms': benchmark.percentile(values, 0.999) * 1000,
+                'max_ms': (values[-1] if values else 0) * 1000}
+    summary = describe([(latency, ok) for _, latency, ok in results])
+    summary['throughput'] = len(latencies) / wall if wall else 0.0
+    summary['methods'] = {name: describe(entries)
+                          for name, entries in sorted(by_label.items())}
+    return summary
+
+
+def _add_stats(total, stats):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _add_stats(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def print_summary(args, summary, cache, workspace_calls):
+    mode = ('%g requests/s offered' % args.rate if args.rate
+            else 'closed loop')
+    print('%d processes x %d threads, %s, %gs measured' % (
+        args.processes, args.threads, mode, args.duration))
+    print('throughput %.1f requests/s, %d requests, %d errors' % (
+        summary['throughput'], summary['requests'], summary['errors']))
+    print('latency ms: p50 %.2f  p90 %.2f  p99 %.2f  p99.9 %.2f  max %.2f' % (
+        summary['p50_ms'], summary['p90_ms'], summary['p99_ms'],
+        summary['p999_ms'], summary['max_ms']))
+    print('%-42s %9s %7s %9s %9s %9s' % (
+        'method', 'requests', 'errors', 'p50 ms', 'p99 ms', 'max ms'))
+    for name, m in summary['methods'].items():
+        print('%-42s %9d %7d %9.2f %9.2f %9.2f' % (
+            name, m['requests'], m['errors'], m['p50_ms'], m['p99_ms'],
+            m['max_ms']))
+    lookups = cache.get('hits', 0) + cache.get('misses', 0)
+    if lookups:
+        print('object cache hit ratio %.3f over %d lookups' % (
+            cache['hits'] / float(lookups), lookups))
+    if workspace_calls is not None:
+        total = sum(workspace_calls.values())
+        print('workspace calls %d (%.2f per request): %s' % (
+            total, total / float(max(1, summary['requests'])),
+            ', '.join('%s %d' % kv for kv in sorted(workspace_calls.items()))))
+
+
+def main(argv=None):
+    global _application
+    parser = argparse.ArgumentParser(
+        description='Load test the TaxonAPI WSGI application.')
+    fakeworkspace.add_arguments(parser)
+    parser.add_argument('--processes', type=int, default=5,
+                        help='worker processes (default 5, as deployed)')
+    parser.add_argument('--threads', type=int, default=5,
+                        help='threads per worker process (default 5)')
+    parser.add_argument('--duration', type=float, default=20,
+                        help='seconds measured (default 20)')
+    parser.add_argument('--warmup', type=float, default=2,
+                        help='seconds run before measuring (default 2)')
+    parser.add_argument('--rate', type=float,
+                        help='offered requests/s; default closed loop')
+    parser.add_argument('--requests', metavar='FILE',
+                        help='JSON-RPC requests to replay, one per line')
+    parser.add_argument('--remap-refs', action='store_true',
+                        help='map the refs of --requests onto the '
+                             'synthetic taxonomy')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='method=weight,... to draw requests from')
+    parser.add_argument('--count', type=int, default=20000,
+                        help='requests to draw from the mix (default 20000)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='write the drawn requests to FILE')
+    parser.add_argument('--workspace-url',
+                        help='use this workspace instead of a FakeWorkspace')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='set a service config option')
+    parser.add_argument('--json', metavar='FILE',
+                        help='also write the results to FILE as JSON')
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('fork')
+    taxonomy = fakeworkspace.SyntheticTaxonomy(args.nodes, args.depth,
+                                               args.genomes)
+    workspace_process = None
+    url = args.workspace_url
+    if url is None:
+        receive, send = context.Pipe(duplex=False)
+        workspace_process = context.Process(target=_serve_workspace,
+                                            args=(args, send), daemon=True)
+        workspace_process.start()
+        url = receive.recv()
+
+    if args.requests:
+        requests = load_requests(args.requests,
+                                 taxonomy if args.remap_refs else None)
+    else:
+        workload = benchmark.Workload(taxonomy, args.seed, args.batch_size)
+        requests = generate(workload, parse_mix(args.mix), args.count,
+                            args.seed)
+        if args.record:
+            with open(args.record, 'w') as f:
+                for request in requests:
+                    f.write(json.dumps(request) + '\n')
+    bodies = [json.dumps(r).encode('utf-8') for r in requests]
+    labels = [label(r) for r in requests]
+
+    _application = benchmark.load_application(
+        benchmark.service_config(url, args.set))
+    start = time.monotonic() + 0.5
+    workers = []
+    for index in range(args.processes):
+        receive, send = context.Pipe(duplex=False)
+        process = context.Process(target=_worker, args=(
+            index, bodies, labels, args, start, send))
+        process.start()
+        workers.append((process, receive))
+    baseline = {}
+    if workspace_process is not None:
+        time.sleep(max(0, start + args.warmup - time.monotonic()))
+        baseline = workspace_stats(url)
+    results = []
+    cache = {}
+    for process, receive in workers:
+        worker_results, stats = receive.recv()
+        results.extend(worker_results)
+        _add_stats(cache, stats.get('cache', {}))
+        process.join()
+
+    workspace_calls = None
+    if workspace_process is not None:
+        workspace_calls = {
+            method: n - baseline.get(method, 0)
+            for method, n in workspace_stats(url).items()
+            if n > baseline.get(method, 0)}
+        workspace_process.terminate()
+    summary = summarize(results, args.duration)
+    print_summary(args, summary, cache, workspace_calls)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'summary': summary,
+                       'cache': cache, 'workspace_calls': workspace_calls},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import datetime
+import json
+import threading
+import unittest
+
+from TaxonAPI.metrics import MAX_TRACE_CALLS, Metrics, current_tally, \
+    propagate, request_refs, trace_header, workspace_method
+
+
+class FakeRequest(object):
+
+    def __init__(self, method, params):
+        self.body = json.dumps({'method': method, 'params': params,
+                                'version': '1.1', 'id': '1'})
+
+
+class FakeResponse(object):
+
+    def __init__(self, method, seconds, content, params=None):
+        self.request = FakeRequest(method, params or [])
+        self.elapsed = datetime.timedelta(seconds=seconds)
+        self.content = content
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.metrics = Metrics(clock=lambda: self.now)
+
+    def ws_call(self, method='Workspace.get_objects2', content=b'{}',
+                params=None):
+        self.metrics.workspace_response(
+            FakeResponse(method, 0.02, content, params))
+
+    def test_request_tallies_workspace_calls(self):
+        with self.metrics.request('TaxonAPI.get_children') as tally:
+            self.ws_call(content=b'x' * 100)
+            self.ws_call('Workspace.list_referencing_objects', b'x' * 10)
+            self.now += 0.3
+        self.assertEqual((tally.calls, tally.bytes), (2, 110))
+        self.assertIsNone(current_tally())
+        text = self.metrics.render()
+        self.assertIn('taxonapi_request_seconds_bucket'
+                      '{le="0.5",method="TaxonAPI.get_children"} 1', text)
+        self.assertIn('taxonapi_request_seconds_bucket'
+                      '{le="0.25",method="TaxonAPI.get_children"} 0', text)
+        self.assertIn('taxonapi_request_workspace_calls_sum'
+                      '{method="TaxonAPI.get_children"} 2', text)
+        self.assertIn('taxonapi_request_workspace_bytes_total'
+                      '{method="TaxonAPI.get_children"} 110', text)
+        self.assertIn('taxonapi_workspace_call_seconds_count'
+                      '{ws_method="Workspace.get_objects2"} 1', text)
+        self.assertIn('taxonapi_workspace_bytes_total'
+                      '{ws_method="Workspace.list_referencing_objects"} 10',
+                      text)
+
+    def test_calls_outside_requests_are_not_tallied(self):
+        self.ws_call()
+        self.assertIn('taxonapi_workspace_call_seconds_count'
+                      '{ws_method="Workspace.get_objects2"} 1',
+                      self.metrics.render())
+        self.assertNotIn('taxonapi_request_seconds_count',
+                         self.metrics.render())
+
+    def test_errors_counted(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.request('TaxonAPI.get_parent'):
+                raise ValueError('no such object')
+        self.assertIn('taxonapi_request_errors_total'
+                      '{method="TaxonAPI.get_parent"} 1',
+                      self.metrics.render())
+
+    def test_propagate_to_other_threads(self):
+        with self.metrics.request('TaxonAPI.get_all_data') as tally:
+            threads = [threading.Thread(target=propagate(self.ws_call))
+                       for _ in range(3)]
+            threading.Thread(target=self.ws_call).start()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(tally.calls, 3)
+
+    def test_stats(self):
+        text = self.metrics.render({'cache': {'hits': 3, 'shared': {
+            'entries': 2}}, 'flights': {'shared': 4}, 'name': 'not a number'})
+        self.assertIn('# TYPE taxonapi_cache_hits_total counter\n'
+                      'taxonapi_cache_hits_total 3\n', text)
+        self.assertIn('# TYPE taxonapi_cache_shared_entries gauge\n'
+                      'taxonapi_cache_shared_entries 2\n', text)
+        self.assertIn('\ntaxonapi_flights_shared_total 4\n', text)
+        self.assertNotIn('not a number', text)
+
+    def test_trace(self):
+        with self.metrics.request('TaxonAPI.get_children', trace=True) as t:
+            self.ws_call('Workspace.list_referencing_objects', b'[]',
+                         [[{'ref': '1/2/3'}]])
+            self.ws_call(params=[{'objects': [
+                {'ref': '1/%d/1' % i} for i in range(8)]}])
+            self.now += 0.25
+        summary = t.summary()
+        self.assertEqual(summary['method'], 'TaxonAPI.get_children')
+        self.assertEqual(summary['ms'], 250)
+        self.assertEqual(summary['workspace_calls'], 2)
+        calls = summary['calls']
+        self.assertEqual(calls[0]['method'],
+                         'Workspace.list_referencing_objects')
+        self.assertEqual(calls[0]['refs'], ['1/2/3'])
+        self.assertEqual(calls[1]['refs'], ['1/0/1', '1/1/1', '1/2/1',
+                                            '1/3/1', '1/4/1'])
+        self.assertEqual(calls[1]['nrefs'], 8)
+        self.assertEqual(calls[1]['ms'], 20)
+
+    def test_trace_size_limited(self):
+        with self.metrics.request('TaxonAPI.get_all_data', trace=True) as t:
+            for _ in range(MAX_TRACE_CALLS + 3):
+                self.ws_call()
+        summary = t.summary()
+        self.assertEqual(summary['workspace_calls'], MAX_TRACE_CALLS + 3)
+        self.assertEqual(len(summary['calls']), MAX_TRACE_CALLS)
+        self.assertEqual(summary['calls_not_shown'], 3)
+
+    def test_untraced_summary(self):
+        with self.metrics.request('TaxonAPI.get_parent') as t:
+            self.ws_call()
+        self.assertNotIn('calls', t.summary())
+
+    def traced_summary(self, calls):
+        with self.metrics.request('TaxonAPI.get_all_data', trace=True) as t:
+            for _ in range(calls):
+                self.ws_call(params=[{'objects': [{'ref': '1/2/3'}]}])
+        return t.summary()
+
+    def test_trace_header_fits(self):
+        trace = [self.traced_summary(2)]
+        self.assertEqual(json.loads(trace_header(trace)), trace)
+
+    def test_trace_header_size_capped(self):
+        trace = [self.traced_summary(MAX_TRACE_CALLS) for _ in range(30)]
+        header = trace_header(trace, max_bytes=2048)
+        self.assertLessEqual(len(header), 2048)
+        shown = json.loads(header)
+        self.assertNotIn('calls', shown[0])
+        self.assertTrue(shown[0]['truncated'])
+        self.assertEqual(shown[0]['workspace_calls'], MAX_TRACE_CALLS)
+        self.assertEqual(shown[-1], {'truncated': True,
+                                     'not_shown': 31 - len(shown)})
+        # not even the marker and one summary fit
+        self.assertEqual(json.loads(trace_header(trace, max_bytes=10)),
+                         [{'truncated': True, 'not_shown': 30}])
+
+    def test_request_refs(self):
+        self.assertEqual(request_refs(json.dumps({'params': [{
+            'objects': [{'ref': '1/2/3', 'obj_ref_path': ['1/5/1']},
+                        {'ref': '4/5/6'}]}]})), ['1/2/3', '4/5/6'])
+        self.assertEqual(request_refs('not json'), [])
+
+    def test_workspace_method(self):
+        self.assertEqual(workspace_method(
+            b'{"method": "Workspace.get_objects2", "params": []}'),
+            'Workspace.get_objects2')
+        self.assertEqual(workspace_method(None), 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from TaxonAPI.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_fetch(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.should_fail:
+            raise ValueError('workspace unavailable')
+        return {'scientific_name': 'Bacillus'}
+
+    def run_concurrently(self, n):
+        results = []
+
+        def caller():
+            try:
+                results.append(self.flights.do('1/2/3', self.slow_fetch))
+            except ValueError as e:
+                results.append(e)
+        threads = [threading.Thread(target=caller) for _ in range(n)]
+        for t in threads:
+            t.start()
+        while self.flights.stats()['shared'] < n - 1:
+            time.sleep(0.001)
+        self.release.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_concurrent_calls_are_coalesced(self):
+        self.should_fail = False
+        results = self.run_concurrently(5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'scientific_name': 'Bacillus'}] * 5)
+        self.assertEqual(self.flights.stats(),
+                         {'calls': 1, 'shared': 4, 'in_flight': 0})
+
+    def test_errors_are_shared(self):
+        self.should_fail = True
+        results = self.run_concurrently(3)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_later_calls_fetch_again(self):
+        self.should_fail = False
+        self.release.set()
+        self.flights.do('1/2/3', self.slow_fetch)
+        self.flights.do('1/2/3', self.slow_fetch)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from TaxonAPI.snapshot import TaxonomySnapshot, export_workspace
+
+
+def taxon_info(obj_id, version=1):
+    return [obj_id, '%d_taxon' % obj_id, 'KBaseGenomeAnnotations.Taxon-1.0',
+            '2015-07-20T00:00:00+0000', version, 'kbasetest', 1779,
+            'ReferenceTaxons', 'abc', 455, {}]
+
+
+TAXA = {
+    1: {'scientific_name': 'root', 'taxonomy_id': 1,
+        'scientific_lineage': '', 'domain': 'Unknown', 'genetic_code': 1},
+    2: {'scientific_name': 'Eukaryota', 'taxonomy_id': 2759,
+        'scientific_lineage': 'cellular organisms', 'domain': 'Eukaryota',
+        'genetic_code': 1, 'aliases': ['eucaryotes'], 'rank': 'superkingdom',
+        'parent_taxon_ref': '1779/1/1'},
+    3: {'scientific_name': 'Rhodophyta', 'taxonomy_id': 2763,
+        'scientific_lineage': 'cellular organisms; Eukaryota',
+        'domain': 'Eukaryota', 'genetic_code': 1, 'kingdom': 'Rhodophyta',
+        'parent_taxon_ref': '1779/2/1'},
+}
+
+
+class FakeWorkspace(object):
+
+    def list_objects(self, params):
+        return [taxon_info(i) for i in TAXA if i >= params['minObjectID']]
+
+    def get_objects2(self, params):
+        return {'data': [{'info': taxon_info(int(o['ref'].split('/')[1])),
+                          'data': TAXA[int(o['ref'].split('/')[1])]}
+                         for o in params['objects']]}
+
+
+class TaxonomySnapshotTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmpdir, 'taxa.jsonl')
+        with open(cls.path, 'w') as f:
+            cls.count = export_workspace(FakeWorkspace(), 'ReferenceTaxons', f)
+        cls.snapshot = TaxonomySnapshot.load_jsonl(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_export(self):
+        self.assertEqual(self.count, 3)
+        self.assertEqual(len(self.snapshot), 3)
+
+    def test_index_of(self):
+        s = self.snapshot
+        self.assertEqual(s.index_of('1779/3/1'), s.index_of('1779/3'))
+        self.assertEqual(s.index_of('ReferenceTaxons/3_taxon/1'),
+                         s.index_of('1779/3/1'))
+        self.assertIsNone(s.index_of('1779/3/2'))
+        self.assertIsNone(s.index_of('1780/3/1'))
+        self.assertIsNone(s.index_of('1779/4/1'))
+        self.assertIsNone(s.index_of('1779/3/1;1779/2/1'))
+
+    def test_get_object(self):
+        # the snapshot always reports aliases, even if the object had none
+        obj = self.snapshot.get_object('ReferenceTaxons/3_taxon/1')
+        self.assertEqual(obj['data'], dict(TAXA[3], aliases=[]))
+        self.assertEqual(obj['info'][:10], taxon_info(3)[:10])
+        self.assertEqual(obj['path'], ['1779/3/1'])
+        self.assertEqual(self.snapshot.get_object('1779/2/1')['data'], TAXA[2])
+        self.assertEqual(self.snapshot.get_object('1779/1/1')['data'],
+                         dict(TAXA[1], aliases=[]))
+
+    def test_projection(self):
+        obj = self.snapshot.get_object(
+            '1779/2/1', fields=['scientific_name', 'parent_taxon_ref'])
+        self.assertEqual(obj['data'], {'scientific_name': 'Eukaryota',
+                                       'parent_taxon_ref': '1779/1/1'})
+        self.assertNotIn('data', self.snapshot.get_object('1779/2/1',
+                                                          no_data=True))
+
+    def test_strings_are_interned(self):
+        # 'Eukaryota' is both a scientific name and a domain
+        strings = self.snapshot.strings
+        values = [strings.get(i) for i in range(len(strings))]
+        self.assertEqual(len(values), len(set(values)))
+        self.assertEqual(values.count('Eukaryota'), 1)
+
+    def test_empty_snapshot(self):
+        path = os.path.join(self.tmpdir, 'empty.jsonl')
+        open(path, 'w').close()
+        with self.assertRaises(ValueError):
+            TaxonomySnapshot.load_jsonl(path)
+
+
+class TaxonomyIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        jsonl = os.path.join(cls.tmpdir, 'taxa.jsonl')
+        with open(jsonl, 'w') as f:
+            export_workspace(FakeWorkspace(), 'ReferenceTaxons', f)
+        cls.built = TaxonomySnapshot.load(jsonl)
+        cls.path = os.path.join(cls.tmpdir, 'taxa.idx')
+        cls.built.write(cls.path)
+        cls.snapshot = TaxonomySnapshot.load(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_round_trip(self):
+        self.assertIsNotNone(self.snapshot._mapping)
+        self.assertEqual(len(self.snapshot), 3)
+        for ref in ['1779/1/1', '1779/2', 'ReferenceTaxons/3_taxon/1']:
+            self.assertEqual(self.snapshot.get_object(ref),
+                             self.built.get_object(ref))
+
+    def test_children(self):
+        root = self.snapshot.index_of('1779/1/1')
+        eukaryota = self.snapshot.index_of('1779/2/1')
+        rhodophyta = self.snapshot.index_of('1779/3/1')
+        self.assertEqual(self.snapshot.children(root), [eukaryota])
+        self.assertEqual(self.snapshot.children(eukaryota), [rhodophyta])
+        self.assertEqual(self.snapshot.children(rhodophyta), [])
+
+    def test_index_of_taxonomy_id(self):
+        self.assertEqual(self.snapshot.index_of_taxonomy_id(2763),
+                         self.snapshot.index_of('1779/3/1'))
+        self.assertEqual(self.snapshot.index_of_taxonomy_id(1),
+                         self.snapshot.index_of('1779/1/1'))
+        self.assertIsNone(self.snapshot.index_of_taxonomy_id(9606))
+
+    def test_not_an_index(self):
+        with self.assertRaises(ValueError):
+            TaxonomySnapshot.load_index(os.path.join(self.tmpdir,
+                                                     'taxa.jsonl'))
@@ -0,0 +1,91 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from TaxonAPI.typetable import TypeTable
+from TaxonAPI.TaxonAPIImpl import TaxonAPI
+
+
+class TypeTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.table = TypeTable(self.translate)
+
+    def translate(self, types):
+        self.calls.append(types)
+        return {t: t.split('-')[0] + '-0123abcd' for t in types}
+
+    def test_distinct_types_translated_once(self):
+        types = ['KBaseGenomes.Genome-8.0', 'KBaseGenomeAnnotations.Taxon-1.0',
+                 'KBaseGenomes.Genome-8.0']
+        expected = {'KBaseGenomes.Genome-8.0': 'KBaseGenomes.Genome-0123abcd',
+                    'KBaseGenomeAnnotations.Taxon-1.0':
+                        'KBaseGenomeAnnotations.Taxon-0123abcd'}
+        self.assertEqual(self.table.translate(types), expected)
+        self.assertEqual(self.table.translate(types), expected)
+        self.assertEqual(self.calls, [['KBaseGenomes.Genome-8.0',
+                                       'KBaseGenomeAnnotations.Taxon-1.0']])
+        self.assertEqual(self.table.stats(), {'types': 2, 'calls': 1})
+
+    def test_only_new_types_translated(self):
+        self.table.translate(['KBaseGenomes.Genome-8.0'])
+        self.table.translate(['KBaseGenomes.Genome-8.0',
+                              'KBaseGenomes.Genome-9.0'])
+        self.assertEqual(self.calls, [['KBaseGenomes.Genome-8.0'],
+                                      ['KBaseGenomes.Genome-9.0']])
+
+    def test_unversioned_types_not_kept(self):
+        self.table.translate(['KBaseGenomes.Genome'])
+        self.table.translate(['KBaseGenomes.Genome'])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_no_types(self):
+        self.assertEqual(self.table.translate([]), {})
+        self.assertEqual(self.calls, [])
+
+
+class TypeWorkspace(BaseHTTPRequestHandler):
+    ''' Answers the type calls of the warm-up over keep-alive connections. '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        arg = req['params'][0]
+        if req['method'] == 'Workspace.get_type_info':
+            result = {'type_vers': [arg + '-1.0']}
+        else:
+            result = {t: t.split('-')[0] + '-0123abcd' for t in arg}
+        body = json.dumps({'version': '1.1', 'result': [result]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WarmUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), TypeWorkspace)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_no_connection_left_open(self):
+        impl = TaxonAPI({'workspace-url': 'http://127.0.0.1:%d' %
+                         self.server.server_address[1],
+                         'shock-url': 'http://localhost/shock'})
+        self.assertEqual(impl.type_table.stats()['calls'], 1)
+        # uwsgi forks after the constructor; an open pooled connection
+        # would be shared by every worker
+        for adapter in impl.ws_session.adapters.values():
+            self.assertEqual(len(adapter.poolmanager.pools), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()